@@ -0,0 +1,22 @@
+import re
+
+# Harakat, tanween, shadda, sukun, dagger alef and Quranic marks.
+_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_TATWEEL = "\u0640"
+_LETTER_VARIANTS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه"})
+_WHITESPACE = re.compile(r"\s+")
+
+
+def strip_diacritics(text: str) -> str:
+    return _DIACRITICS.sub("", text).replace(_TATWEEL, "")
+
+
+def normalize_arabic(text: str) -> str:
+    """
+    Canonical form used for cache keys and lexical matching: diacritics and tatweel
+    removed, alef/yaa/taa-marbuta variants unified, whitespace collapsed.
+    """
+    if not text:
+        return ""
+    text = strip_diacritics(text).translate(_LETTER_VARIANTS)
+    return _WHITESPACE.sub(" ", text).strip().lower()
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", str(7 * 24 * 3600)))
+REQUIRE_SESSION_TOKEN = os.getenv("REQUIRE_SESSION_TOKEN", "0") == "1"
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+if not SESSION_SECRET:
+    # Tokens from a random secret only verify in this process, so set SESSION_SECRET
+    # when running several workers or when sessions must survive restarts.
+    logger.warning("SESSION_SECRET is not set, using a random per-process secret.")
+    SESSION_SECRET = secrets.token_hex(32)
+
+_SECRET_BYTES = SESSION_SECRET.encode("utf-8")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SECRET_BYTES, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_session_token(email: str, ttl: int = SESSION_TOKEN_TTL) -> str:
+    """
+    Returns a signed, expiring token "<payload>.<signature>" identifying email.
+    """
+    now = int(time.time())
+    payload = _b64encode(json.dumps({"sub": email, "iat": now, "exp": now + ttl}).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str):
+    """
+    Returns the email in a valid, unexpired token, or None.
+    """
+    if not isinstance(token, str):
+        # The token comes straight from client JSON and may be any type.
+        return None
+    try:
+        payload, signature = token.split(".", 1)
+        # compare_digest only accepts ASCII str, so compare the encoded bytes.
+        if not hmac.compare_digest(signature.encode("utf-8"), _sign(payload).encode("ascii")):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims.get("sub")
+
+
+def resolve_email(authorization: str = "", email: str = None) -> str:
+    """
+    Identifies the caller from an "Authorization: Bearer <token>" header, falling
+    back to the legacy raw email unless REQUIRE_SESSION_TOKEN is set.
+    """
+    if authorization and authorization.lower().startswith("bearer "):
+        token_email = verify_session_token(authorization[7:].strip())
+        if token_email is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired session token.")
+        return token_email
+    if REQUIRE_SESSION_TOKEN or not email:
+        raise HTTPException(status_code=401, detail="Session token required.")
+    return email
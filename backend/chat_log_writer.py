@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db import db
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOG_FLUSH_SIZE = int(os.getenv("CHAT_LOG_FLUSH_SIZE", "100"))
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1.0"))
+CHAT_LOG_MAX_PENDING = int(os.getenv("CHAT_LOG_MAX_PENDING", "50000"))
+CHAT_LOG_MAX_ATTEMPTS = int(os.getenv("CHAT_LOG_MAX_ATTEMPTS", "3"))
+
+
+class ChatLogWriter:
+    """
+    Write-behind persistence for chat turns. append() only touches memory; a
+    background task flushes pending turns with one bulk_write per batch, grouping
+    all turns of a conversation into a single $push.
+    """
+
+    def __init__(self, flush_size: int = CHAT_LOG_FLUSH_SIZE, flush_interval: float = CHAT_LOG_FLUSH_INTERVAL,
+                 max_pending: int = CHAT_LOG_MAX_PENDING, max_attempts: int = CHAT_LOG_MAX_ATTEMPTS):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._failures = {}
+        self._wake = None
+        self._task = None
+        self._flush_lock = None
+        self._closing = False
+        self.turns_written = 0
+        self.bulk_writes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    @staticmethod
+    def new_chat_id() -> ObjectId:
+        return ObjectId()
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def append(self, chat_id: ObjectId, email: str, sender: str, text: str):
+        self._pending.append((chat_id, email, {"sender": sender, "text": text}, datetime.utcnow()))
+        if len(self._pending) > self.max_pending:
+            # Mongo has been unreachable for a while; keep memory bounded.
+            overflow = len(self._pending) - self.max_pending
+            del self._pending[:overflow]
+            self.dropped += overflow
+        if self._wake is not None and len(self._pending) >= self.flush_size:
+            self._wake.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+
+            conversations = OrderedDict()
+            for chat_id, email, turn, at in batch:
+                entry = conversations.setdefault(chat_id, {"email": email, "turns": [], "first": at, "last": at})
+                entry["turns"].append(turn)
+                entry["last"] = at
+
+            chat_ids = list(conversations)
+            operations = [
+                UpdateOne(
+                    {"_id": chat_id},
+                    {
+                        "$push": {"chat": {"$each": entry["turns"]}},
+                        "$set": {"updated_at": entry["last"]},
+                        "$setOnInsert": {"email": entry["email"], "timestamp": entry["first"]},
+                    },
+                    upsert=True,
+                )
+                for chat_id, entry in conversations.items()
+            ]
+
+            try:
+                await db.chat_logs.bulk_write(operations, ordered=True)
+            except asyncio.CancelledError:
+                self._pending = batch + self._pending
+                raise
+            except BulkWriteError as e:
+                # The writes are ordered: everything before the failing operation is
+                # stored and everything after it was not attempted.
+                self.failed_flushes += 1
+                failed_at = e.details["writeErrors"][0]["index"]
+                self._requeue(batch, chat_ids[:failed_at], chat_ids[failed_at], chat_ids[failed_at + 1:], e)
+                return
+            except Exception as e:
+                # Put the batch back in front of anything appended meanwhile and retry
+                # on the next tick.
+                self.failed_flushes += 1
+                self._pending = batch + self._pending
+                logger.warning("Chat log flush failed, %d turns kept for retry: %s", len(batch), e)
+                return
+
+            self._written(batch, chat_ids)
+            self.bulk_writes += 1
+
+    def _written(self, batch: list, chat_ids: list):
+        written = set(chat_ids)
+        for chat_id in written:
+            self._failures.pop(chat_id, None)
+        self.turns_written += sum(1 for chat_id, *_ in batch if chat_id in written)
+
+    def _requeue(self, batch: list, written: list, failed: ObjectId, remaining: list, error: Exception):
+        self._written(batch, written)
+        retry = set(remaining)
+        self._failures[failed] = self._failures.get(failed, 0) + 1
+        if self._failures[failed] >= self.max_attempts:
+            # The same conversation keeps failing (e.g. its document hit Mongo's size
+            # limit); retrying it would block every flush behind it.
+            self._failures.pop(failed)
+            lost = sum(1 for chat_id, *_ in batch if chat_id == failed)
+            self.dropped += lost
+            logger.error("Dropping %d chat turns of conversation %s after %d failed writes: %s",
+                         lost, failed, self.max_attempts, error)
+        else:
+            retry.add(failed)
+        requeued = [item for item in batch if item[0] in retry]
+        self._pending = requeued + self._pending
+        logger.warning("Chat log flush failed at conversation %s, %d turns kept for retry: %s",
+                       failed, len(requeued), error)
+
+    async def close(self):
+        """
+        Stops the background task and drains everything still pending.
+        """
+        if self._task is not None:
+            # The loop is asked to stop rather than cancelled, so a bulk_write in
+            # flight completes (or puts its batch back) before the final flush.
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        if self._flush_lock is not None:
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "turns_written": self.turns_written,
+            "bulk_writes": self.bulk_writes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
+
+
+chat_log_writer = ChatLogWriter()
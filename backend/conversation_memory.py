@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from llm_clients import get_async_groq, CLASSIFIER_MODEL, CLASSIFIER_TIMEOUT
+from token_count import count_tokens
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_TURN_MAX_TOKENS = int(os.getenv("MEMORY_TURN_MAX_TOKENS", "300"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "250"))
+MEMORY_SUMMARIZATION = os.getenv("MEMORY_SUMMARIZATION", "1") == "1"
+
+SUMMARY_PREFIX = "ملخص المحادثة السابقة: "
+
+SUMMARY_PROMPT = """
+أنت تلخص محادثة بين مستخدم وروبوت دردشة متخصص في الطعام.
+ادمج الملخص السابق مع الرسائل الجديدة في ملخص واحد قصير باللغة العربية.
+احتفظ فقط بما يفيد بقية المحادثة: طلبات المستخدم، الوصفات التي عُرضت عليه بالاسم، ما أعجبه أو رفضه، وأي معلومة شخصية ذكرها.
+لا تكتب أي شيء غير الملخص.
+"""
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text to roughly max_tokens tokens, keeping its beginning.
+    """
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(1, len(text) * max_tokens // tokens)].rstrip() + " …"
+
+
+class Turn:
+    __slots__ = ("human", "ai", "tokens")
+
+    def __init__(self, human: str, ai: str):
+        self.human = human
+        self.ai = ai
+        self.tokens = count_tokens(human) + count_tokens(ai)
+
+
+class BudgetedConversationMemory:
+    """
+    Conversation memory with a hard token budget for the history sent to the LLM.
+    Turns store a recipe's title instead of its body and long replies are cut to
+    MEMORY_TURN_MAX_TOKENS. When the turns exceed the budget, the oldest ones leave
+    the prompt immediately and are folded into a running summary by a background
+    task, so summarization never delays a reply.
+    """
+
+    def __init__(self, token_budget: int = MEMORY_TOKEN_BUDGET, turn_max_tokens: int = MEMORY_TURN_MAX_TOKENS,
+                 summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS, summarize: bool = MEMORY_SUMMARIZATION):
+        self.token_budget = token_budget
+        self.turn_max_tokens = turn_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarize = summarize
+        self.turns = []
+        self.summary = ""
+        self.summary_tokens = 0
+        self._evicted = []
+        self._summary_task = None
+
+    @staticmethod
+    def format_input(user_input: str, retrieved_data: str, recipe_title: str = None) -> str:
+        """
+        The human side of a stored turn: a recipe is kept by reference only.
+        """
+        if recipe_title:
+            return f"Retrieved Recipe: {recipe_title}\nUser Question: {user_input}"
+        return f"Retrieved Data: {retrieved_data}\nUser Question: {user_input}"
+
+    def save_turn(self, human: str, ai: str):
+        self.turns.append(Turn(
+            truncate_to_tokens(human, self.turn_max_tokens),
+            truncate_to_tokens(ai, self.turn_max_tokens),
+        ))
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        # The latest turn always stays, even if it alone exceeds the budget.
+        while len(self.turns) > 1 and self.tokens() > self.token_budget:
+            self._evicted.append(self.turns.pop(0))
+        if self._evicted and self.summarize and self._summary_task is None:
+            self._summary_task = asyncio.create_task(self._summarize())
+        elif not self.summarize:
+            self._evicted.clear()
+
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    async def _summarize(self):
+        try:
+            while self._evicted:
+                batch, self._evicted = self._evicted, []
+                transcript = "\n".join(f"human: {turn.human}\nai: {turn.ai}" for turn in batch)
+                completion = await get_async_groq().chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": f"الملخص السابق:\n{self.summary or 'لا يوجد'}\n\nالرسائل الجديدة:\n{transcript}"},
+                    ],
+                    model=CLASSIFIER_MODEL,
+                    temperature=0.0,
+                    max_tokens=self.summary_max_tokens,
+                    timeout=CLASSIFIER_TIMEOUT,
+                )
+                summary = (completion.choices[0].message.content or "").strip()
+                if summary:
+                    self.summary = truncate_to_tokens(summary, self.summary_max_tokens)
+                    self.summary_tokens = count_tokens(SUMMARY_PREFIX + self.summary)
+                # A longer summary can push the turns over the budget again.
+                while len(self.turns) > 1 and self.tokens() > self.token_budget:
+                    self._evicted.append(self.turns.pop(0))
+        except Exception as e:
+            # The evicted turns are dropped; the previous summary stays in place.
+            logger.warning("Conversation summarization failed: %r", e)
+            self._evicted.clear()
+        finally:
+            self._summary_task = None
+
+    def messages(self) -> list:
+        """
+        The history to place between the system prompt and the new input.
+        """
+        history = [SystemMessage(content=SUMMARY_PREFIX + self.summary)] if self.summary else []
+        for turn in self.turns:
+            history.append(HumanMessage(content=turn.human))
+            history.append(AIMessage(content=turn.ai))
+        return history
+
+    def recent_context(self, n: int = 10) -> str:
+        """
+        The last n messages as "type: content" lines, for the classifier.
+        """
+        return "\n".join(f"{m.type}: {m.content}" for m in self.messages()[-n:])
@@ -0,0 +1,38 @@
+import hashlib
+import os
+
+CORPUS_DIR = os.getenv(
+    "RECIPES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "recipes_from_pagebreaks"),
+)
+
+
+def parse_recipe_file(path: str) -> dict:
+    """
+    Reads a recipe_NNN.txt file. The first non-empty line is the title and the whole
+    file is the document.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    text = raw.decode("utf-8").strip()
+    title = next((line.strip() for line in text.splitlines() if line.strip()), "وصفة بدون عنوان")
+    filename = os.path.basename(path)
+    return {
+        "id": os.path.splitext(filename)[0],
+        "title": title,
+        "document": text,
+        "metadata": {"title": title, "source": filename},
+        "sha256": hashlib.sha256(raw).hexdigest(),
+    }
+
+
+def load_corpus(corpus_dir: str = CORPUS_DIR) -> dict:
+    """
+    Returns every recipe in corpus_dir keyed by its id (the file name without .txt).
+    """
+    recipes = {}
+    for filename in sorted(os.listdir(corpus_dir)):
+        if filename.endswith(".txt"):
+            recipe = parse_recipe_file(os.path.join(corpus_dir, filename))
+            recipes[recipe["id"]] = recipe
+    return recipes
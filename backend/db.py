@@ -9,3 +9,12 @@ DB_NAME = os.getenv("DB_NAME")
 
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
 db = client[DB_NAME]
+
+
+async def ensure_indexes():
+    """
+    Creates the indexes the queries in utils.py rely on. Safe to run on every start.
+    """
+    await db.users.create_index("email", unique=True, name="email_unique")
+    # _id is part of the key so the index also covers the listing's tie-breaking sort.
+    await db.chat_logs.create_index([("email", 1), ("timestamp", -1), ("_id", -1)], name="email_timestamp_id")
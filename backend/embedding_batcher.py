@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from collections import Counter, deque
+
+EMBED_BATCHING_ENABLED = os.getenv("EMBED_BATCHING", "1") == "1"
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class EmbeddingBatcher:
+    """
+    Collects encode requests from all sessions for up to window_ms (or until
+    max_batch_size requests are waiting) and runs them as one batched forward pass
+    in a worker thread. Each caller awaits its own row of the result.
+    """
+
+    def __init__(self, encode_fn, window_ms: float = EMBED_BATCH_WINDOW_MS,
+                 max_batch_size: int = EMBED_MAX_BATCH_SIZE, history: int = 2048):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=history)
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def embed(self, text: str):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        self.requests += 1
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return [item for item in batch if not item[1].done()]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.queue_delays.append(started - enqueued_at)
+            self.batch_sizes[len(batch)] += 1
+            self.batches += 1
+
+            try:
+                vectors = await asyncio.to_thread(self.encode_fn, [text for text, _, _ in batch])
+            except Exception as e:
+                self.errors += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self) -> dict:
+        delays_ms = [delay * 1000 for delay in self.queue_delays]
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "mean_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "batch_size_distribution": dict(sorted(self.batch_sizes.items())),
+            "queue_delay_ms": {
+                "p50": round(_percentile(delays_ms, 0.50), 3),
+                "p95": round(_percentile(delays_ms, 0.95), 3),
+                "max": round(max(delays_ms), 3) if delays_ms else 0.0,
+            },
+        }
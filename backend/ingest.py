@@ -0,0 +1,208 @@
+"""
+Builds or updates the recipe vector store from recipes_from_pagebreaks/.
+
+    python ingest.py                      # incremental, backend from VECTOR_BACKEND
+    python ingest.py --backend mmap --workers 4 --batch-size 128
+    python ingest.py --full               # ignore the manifest and rebuild everything
+
+A content-hash manifest is kept next to the vector index so that a re-run only
+re-embeds recipe files that were added or changed, and drops deleted ones.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from corpus import CORPUS_DIR, load_corpus
+from retrieval import (
+    COLLECTION_NAME, CHROMA_HOST, CHROMA_PORT, EMBEDDING_MODEL, VECTOR_BACKEND, VECTOR_INDEX_PATH, manifest_path,
+)
+from vector_index import MmapVectorIndex, write_index
+
+DEFAULT_BATCH_SIZE = 64
+MANIFEST_VERSION = 1
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def diff_corpus(recipes: dict, manifest: dict) -> tuple:
+    """
+    Returns (added, changed, deleted, unchanged) recipe id lists.
+    """
+    known = manifest.get("files", {})
+    added = [rid for rid in recipes if rid not in known]
+    changed = [rid for rid in recipes if rid in known and known[rid]["sha256"] != recipes[rid]["sha256"]]
+    deleted = [rid for rid in known if rid not in recipes]
+    unchanged = [rid for rid in recipes if rid in known and rid not in changed]
+    return added, changed, deleted, unchanged
+
+
+_worker_model = None
+
+
+def _init_worker(model_name: str):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_batch(texts: list) -> np.ndarray:
+    return np.asarray(
+        _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype=np.float32
+    )
+
+
+def embed_documents(texts: list, model_name: str, batch_size: int, workers: int) -> np.ndarray:
+    """
+    Embeds texts in batches of batch_size. With more than one worker each process
+    loads the model once and handles whole batches.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if workers <= 1 or len(batches) == 1:
+        _init_worker(model_name)
+        return np.vstack([_encode_batch(batch) for batch in batches])
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=_init_worker,
+                             initargs=(model_name,)) as pool:
+        return np.vstack(list(pool.map(_encode_batch, batches)))
+
+
+def write_mmap(recipes: dict, to_embed: list, embeddings: np.ndarray, dtype: str, full: bool):
+    """
+    Rewrites the index file, reusing stored rows for recipes that did not change.
+    """
+    previous = {}
+    if not full and os.path.exists(VECTOR_INDEX_PATH):
+        index = MmapVectorIndex.open(VECTOR_INDEX_PATH)
+        if index.header.get("model") == EMBEDDING_MODEL:
+            previous = {record["id"]: np.array(index.matrix[row], dtype=np.float32)
+                        for row, record in enumerate(index.records)}
+
+    fresh = dict(zip(to_embed, embeddings))
+    records, rows = [], []
+    for rid, recipe in recipes.items():
+        vector = fresh.get(rid)
+        if vector is None:
+            vector = previous[rid]
+        rows.append(vector)
+        records.append({key: recipe[key] for key in ("id", "title", "document", "metadata")})
+
+    matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+    return write_index(VECTOR_INDEX_PATH, matrix, records, model_name=EMBEDDING_MODEL, dtype=dtype)["generation"]
+
+
+def write_chroma(recipes: dict, to_embed: list, embeddings: np.ndarray, deleted: list, full: bool):
+    import chromadb
+
+    client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    if full:
+        try:
+            client.delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+    collection = client.get_or_create_collection(COLLECTION_NAME)
+
+    if deleted:
+        collection.delete(ids=deleted)
+    if to_embed:
+        collection.upsert(
+            ids=to_embed,
+            embeddings=embeddings.tolist(),
+            documents=[recipes[rid]["document"] for rid in to_embed],
+            metadatas=[recipes[rid]["metadata"] for rid in to_embed],
+        )
+    return None
+
+
+def ingest(corpus_dir: str = CORPUS_DIR, backend: str = VECTOR_BACKEND, manifest_file: str = None,
+           batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1, full: bool = False, dtype: str = "float32") -> dict:
+    manifest_file = manifest_file or manifest_path(backend)
+    manifest = load_manifest(manifest_file)
+    if manifest.get("model") != EMBEDDING_MODEL or manifest.get("version") != MANIFEST_VERSION:
+        full = True
+    if backend == "mmap" and not os.path.exists(VECTOR_INDEX_PATH):
+        full = True
+    if full:
+        manifest = {}
+
+    recipes = load_corpus(corpus_dir)
+    added, changed, deleted, unchanged = diff_corpus(recipes, manifest)
+    summary = {
+        "backend": backend,
+        "added": len(added),
+        "changed": len(changed),
+        "deleted": len(deleted),
+        "unchanged": len(unchanged),
+        "full_rebuild": full,
+    }
+    print(f"📚 {len(recipes)} recipes: {summary['added']} added, {summary['changed']} changed, "
+          f"{summary['deleted']} deleted, {summary['unchanged']} unchanged.")
+
+    if not (added or changed or deleted):
+        print("✅ Vector store is up to date.")
+        summary["generation"] = manifest.get("generation")
+        return summary
+
+    to_embed = added + changed
+    started = time.perf_counter()
+    embeddings = embed_documents([recipes[rid]["document"] for rid in to_embed], EMBEDDING_MODEL, batch_size, workers)
+    print(f"🧮 Embedded {len(to_embed)} recipes in {time.perf_counter() - started:.1f}s.")
+
+    if backend == "mmap":
+        generation = write_mmap(recipes, to_embed, embeddings, dtype, full)
+    elif backend == "chroma":
+        generation = write_chroma(recipes, to_embed, embeddings, deleted, full)
+    else:
+        raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+
+    save_manifest(manifest_file, {
+        "version": MANIFEST_VERSION,
+        "model": EMBEDDING_MODEL,
+        "backend": backend,
+        "generation": generation or f"{time.time():.6f}",
+        "updated_at": time.time(),
+        "files": {rid: {"sha256": recipe["sha256"], "title": recipe["title"]} for rid, recipe in recipes.items()},
+    })
+    summary["generation"] = generation
+    print(f"✅ Vector store updated ({backend}).")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed recipes_from_pagebreaks into the configured vector store.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Directory with recipe_NNN.txt files.")
+    parser.add_argument("--backend", default=VECTOR_BACKEND, choices=["chroma", "mmap"])
+    parser.add_argument("--manifest", default=None, help="Path of the content-hash manifest.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)))
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"],
+                        help="Storage dtype for the mmap index.")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rebuild everything.")
+    args = parser.parse_args()
+
+    ingest(corpus_dir=args.corpus, backend=args.backend, manifest_file=args.manifest,
+           batch_size=args.batch_size, workers=args.workers, full=args.full, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import difflib
+import logging
+import os
+import re
+import threading
+
+from arabic_text import normalize_arabic
+from corpus import load_corpus
+
+logger = logging.getLogger(__name__)
+
+NOT_FOOD_RELATED = "not food related"
+FOOD_GENERALIZED = "food generalized"
+
+INTENT_FASTPATH_ENABLED = os.getenv("INTENT_FASTPATH", "1") == "1"
+FUZZY_CUTOFF = float(os.getenv("INTENT_FASTPATH_FUZZY_CUTOFF", "0.88"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_PARENTHESES = re.compile(r"\(.*?\)")
+
+GREETINGS = [
+    "ازيك", "ازيك عامل ايه", "ازيكم", "عامل ايه", "عامله ايه", "اخبارك ايه", "ايه الاخبار",
+    "السلام عليكم", "وعليكم السلام", "اهلا", "اهلا وسهلا", "اهلين", "مرحبا", "هاي", "هلا",
+    "صباح الخير", "صباح النور", "مساء الخير", "مساء النور", "تصبح على خير",
+    "شكرا", "شكرا جزيلا", "متشكر", "متشكره", "مع السلامه", "باي",
+    "hi", "hello", "hey", "good morning", "good evening",
+]
+
+# Words that make a message an explicit request, and filler that may surround the
+# dish name in one ("انا عايز وصفة كشري لو سمحت").
+REQUEST_WORDS = {"عايز", "عاوز", "عايزه", "عاوزه", "هاتلي", "اعملي", "جربلي", "اريد", "بدي", "وصفه"}
+FILLER_WORDS = REQUEST_WORDS | {"انا", "ممكن", "هات", "طريقه", "عمل", "لو", "سمحت", "من", "فضلك", "يا", "شيف"}
+NEGATION_WORDS = {"مش", "لا", "ماعايزش", "بلاش", "مبحبش", "غير", "بدون"}
+MEAL_WORDS = {"فطار", "فطور", "افطار", "غدا", "غداء", "عشا", "عشاء", "سحور"}
+
+
+def _tokens(text: str) -> list:
+    text = _PUNCTUATION.sub(" ", normalize_arabic(_PARENTHESES.sub(" ", text)))
+    return [_strip_article(token) for token in text.split()]
+
+
+def _strip_article(token: str) -> str:
+    if token.startswith("لل") and len(token) > 4:
+        return token[2:]
+    return token[2:] if token.startswith("ال") and len(token) > 3 else token
+
+
+def title_key(text: str) -> str:
+    """
+    Matching key for a title or a requested dish: normalized, without punctuation,
+    parenthesised notes or the definite article.
+    """
+    return " ".join(_tokens(text))
+
+
+def request_key(text: str) -> str:
+    """
+    title_key() of a message with the request filler removed, i.e. the dish part of
+    "انا عايز وصفة كشري".
+    """
+    return " ".join(token for token in _tokens(text) if token not in FILLER_WORDS)
+
+
+class IntentFastPath:
+    """
+    Local first stage for the intent classifier. It answers only the cases it is
+    sure about and returns None for everything else, which goes to the LLM.
+    """
+
+    def __init__(self, titles: list = None, fuzzy_cutoff: float = FUZZY_CUTOFF):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.greetings = {title_key(phrase) for phrase in GREETINGS}
+        self.title_index = {}
+        self._keys = []
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.counters = {"total": 0, "greeting": 0, "meal_time": 0, "dish_exact": 0, "dish_fuzzy": 0, "fallback": 0}
+        if titles is not None:
+            self.build(titles)
+
+    def build(self, titles: list):
+        index = {}
+        for title in titles:
+            # Keyed like request_key() so that filler in a title ("وصفة ...", "طريقة
+            # عمل ...") doesn't stop a request for the dish from matching it.
+            index.setdefault(request_key(title) or title_key(title), title.strip())
+        with self._lock:
+            self.title_index = index
+            self._keys = list(index)
+            self._loaded = True
+
+    def load(self):
+        """
+        Builds the title index from the recipe corpus, once.
+        """
+        if self._loaded:
+            return
+        try:
+            self.build([recipe["title"] for recipe in load_corpus().values()])
+            logger.info("Intent fast path indexed %d recipe titles.", len(self.title_index))
+        except OSError as e:
+            logger.warning("Intent fast path disabled, recipe corpus not readable: %s", e)
+            self.build([])
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def match_title(self, text: str):
+        key = title_key(text)
+        if len(key) < 3:
+            return None, None
+        if key in self.title_index:
+            return self.title_index[key], "dish_exact"
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=self.fuzzy_cutoff)
+        if close:
+            return self.title_index[close[0]], "dish_fuzzy"
+        return None, None
+
+    def classify(self, message: str):
+        """
+        Returns "not food related", "food generalized", a recipe title, or None when
+        the remote classifier has to decide.
+        """
+        self.load()
+        self._count("total")
+        tokens = _tokens(message)
+        if not tokens:
+            self._count("fallback")
+            return None
+
+        if " ".join(tokens) in self.greetings:
+            self._count("greeting")
+            return NOT_FOOD_RELATED
+
+        if any(token in NEGATION_WORDS for token in tokens):
+            self._count("fallback")
+            return None
+
+        is_request = any(token in REQUEST_WORDS for token in tokens)
+        if any(token in MEAL_WORDS for token in tokens) and (is_request or len(tokens) <= 3):
+            self._count("meal_time")
+            return FOOD_GENERALIZED
+
+        if is_request:
+            title, kind = self.match_title(request_key(message))
+            if title:
+                self._count(kind)
+                return title
+
+        self._count("fallback")
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        answered = counters["total"] - counters["fallback"]
+        counters["remote_calls_avoided"] = answered
+        counters["avoided_rate"] = round(answered / counters["total"], 4) if counters["total"] else 0.0
+        counters["titles"] = len(self.title_index)
+        return counters
+
+
+intent_fastpath = IntentFastPath()
@@ -0,0 +1,113 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from arabic_text import normalize_arabic
+
+_NON_WORD = re.compile(r"[^\w]+")
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("هما", "ات", "ان", "ون", "ين", "يه", "ها", "ه", "ي")
+STOPWORDS = {
+    normalize_arabic(word) for word in (
+        "في", "من", "على", "الى", "إلى", "عن", "مع", "او", "أو", "و", "ثم", "كل", "هذا", "هذه", "دي", "ده",
+        "اللي", "انا", "أنا", "عايز", "عاوز", "ممكن", "وصفة", "وصفه", "طريقة", "عمل", "حاجة", "شوية", "لو",
+    )
+}
+
+
+def light_stem(token: str) -> str:
+    """
+    Light Arabic stemming: drop one attached article/conjunction prefix and one
+    common plural, feminine or pronoun suffix, keeping at least three letters.
+    """
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            token = token[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    return token
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in _NON_WORD.split(normalize_arabic(text)):
+        if token and token not in STOPWORDS and not token.isdigit():
+            tokens.append(light_stem(token))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over recipe titles and bodies. Title terms are
+    counted title_weight times so a literal dish-name match ranks first.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, title_weight: int = 3):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.records = []
+        self.postings = {}
+        self.idf = {}
+        self.doc_lengths = []
+        self.avg_length = 0.0
+
+    def build(self, records: list):
+        """
+        records: [{"title", "document"}, ...]
+        """
+        postings = defaultdict(list)
+        doc_lengths = []
+        for doc_id, record in enumerate(records):
+            terms = Counter(tokenize(record["document"]))
+            for term in tokenize(record["title"]):
+                terms[term] += self.title_weight
+            for term, tf in terms.items():
+                postings[term].append((doc_id, tf))
+            doc_lengths.append(sum(terms.values()))
+
+        n_docs = len(records)
+        self.records = records
+        self.postings = dict(postings)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self.doc_lengths = doc_lengths
+        self.avg_length = sum(doc_lengths) / n_docs if n_docs else 0.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query: str, k: int = 20) -> list:
+        """
+        Returns the top-k (record, BM25 score) pairs, best first.
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.records[doc_id], score) for doc_id, score in ranked]
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int = 60, key=lambda result: result["title"]) -> list:
+    """
+    Fuses several best-first result lists by summing 1 / (k + rank) per result.
+    """
+    fused, first_seen = defaultdict(float), {}
+    for results in result_lists:
+        for rank, result in enumerate(results, 1):
+            result_key = key(result)
+            fused[result_key] += 1.0 / (k + rank)
+            first_seen.setdefault(result_key, result)
+    ordered = sorted(fused, key=lambda result_key: fused[result_key], reverse=True)
+    return [dict(first_seen[result_key], rrf_score=fused[result_key]) for result_key in ordered]
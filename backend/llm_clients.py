@@ -0,0 +1,68 @@
+import os
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq
+from langchain_groq import ChatGroq
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct")
+CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct")
+CLASSIFIER_TIMEOUT = float(os.getenv("CLASSIFIER_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+# One async HTTP connection pool per process, shared by the classifier client and
+# the chat model so that concurrent sessions reuse keep-alive connections.
+_http_client = None
+_async_groq = None
+_chat_llm = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+        )
+    return _http_client
+
+
+def get_async_groq() -> AsyncGroq:
+    global _async_groq
+    if _async_groq is None:
+        _async_groq = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            http_client=get_http_client(),
+            timeout=CLASSIFIER_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES,
+        )
+    return _async_groq
+
+
+def get_chat_llm() -> ChatGroq:
+    """
+    The ChatGroq instance shared by every WebSocketBotSession.
+    """
+    global _chat_llm
+    if _chat_llm is None:
+        _chat_llm = ChatGroq(
+            groq_api_key=GROQ_API_KEY,
+            model_name=CHAT_MODEL,
+            request_timeout=LLM_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES,
+            http_async_client=get_http_client(),
+        )
+    return _chat_llm
+
+
+async def close_clients():
+    global _http_client, _async_groq, _chat_llm
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = _async_groq = _chat_llm = None
@@ -0,0 +1,443 @@
+"""
+Load test for /ws/chat. Runs the real FastAPI app in-process against local
+stand-ins for Groq, the vector store and MongoDB, so no API quota is used.
+
+    python loadtest.py --users 50 --conversations 3
+    python loadtest.py --users 200 --llm-latency 0.5 --tokens-per-second 150 --output run.json
+    python loadtest.py --real-embeddings     # encode with the SentenceTransformer model
+
+Each simulated user runs scripted conversations (greeting, dish request, numeric
+choice, follow-up). The report gives throughput, latency percentiles per message
+type and event-loop lag. The server and the clients share one event loop, so the
+lag includes the clients' own (small) overhead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import time
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+
+# Must be set before the app modules read their configuration.
+os.environ.setdefault("DB_NAME", "loadtest")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+GREETING = "أهلا"
+DISH_REQUEST = "عايز أعمل {title}"
+FOLLOW_UP = "ينفع أعملها من غير بصل؟"
+FINAL_FRAMES = {"response", "suggestions", "error", "reset"}
+# The final frame each scripted message should get; anything else is counted as unexpected.
+EXPECTED_OUTCOMES = {"greeting": "response", "dish_request": "suggestions", "choice": "response", "follow_up": "response"}
+FAKE_REPLY_WORDS = ["تمام", "يا", "فندم", "دي", "وصفة", "سهلة", "وطعمها", "حلو", "جدا", "جربها"]
+EMBEDDING_DIM = 384
+
+_CURRENT_MESSAGE = re.compile(r"رسالة المستخدم الحالية:\s*(.+)", re.S)
+_DISH_REQUEST = re.compile(re.escape(DISH_REQUEST).replace(re.escape("{title}"), "(.+)"))
+SCRIPTED_LABELS = {GREETING: "not food related", FOLLOW_UP: "respond based on chat history"}
+
+
+class FakeChatModel:
+    """
+    Stands in for the shared ChatGroq: replies after first_token_latency and then
+    streams reply_tokens tokens at tokens_per_second.
+    """
+
+    def __init__(self, first_token_latency: float, tokens_per_second: float, reply_tokens: int, chunk_tokens: int = 5):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.chunk_tokens = chunk_tokens
+        self.calls = 0
+
+    def _words(self):
+        return [FAKE_REPLY_WORDS[i % len(FAKE_REPLY_WORDS)] for i in range(self.reply_tokens)]
+
+    async def astream(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        words = self._words()
+        for start in range(0, len(words), self.chunk_tokens):
+            chunk = words[start:start + self.chunk_tokens]
+            if start:
+                await asyncio.sleep(len(chunk) / self.tokens_per_second)
+            yield SimpleNamespace(content=" ".join(chunk) + " ")
+
+    async def ainvoke(self, messages):
+        parts = [chunk.content async for chunk in self.astream(messages)]
+        return SimpleNamespace(content="".join(parts).strip())
+
+
+class FakeGroq:
+    """
+    Stands in for AsyncGroq chat completions (classifier and memory summarizer).
+    Classifies the scripted messages the way the real classifier would: a dish
+    request becomes the dish title, the greeting and the follow-up get their labels
+    and anything else is passed through as a search query.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content = messages[-1]["content"]
+        match = _CURRENT_MESSAGE.search(content)
+        answer = self.classify(match.group(1).strip()) if match else "ملخص قصير للمحادثة."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+    @staticmethod
+    def classify(message: str) -> str:
+        if message in SCRIPTED_LABELS:
+            return SCRIPTED_LABELS[message]
+        dish = _DISH_REQUEST.fullmatch(message)
+        return dish.group(1) if dish else message
+
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words embeddings with the SentenceTransformer encode()
+    signature, so retrieval runs without loading the model.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy=True):
+        from arabic_text import normalize_arabic
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in normalize_arabic(text).split():
+                # crc32 rather than hash(), which is salted per process.
+                vectors[row, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+class InMemoryBackend:
+    """
+    Vector backend over a numpy matrix, with the interface of ChromaBackend.
+    """
+
+    name = "memory"
+
+    def __init__(self, records: list, matrix: np.ndarray):
+        self.records = records
+        self.matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+        self.generation = "loadtest"
+        self.is_ready = True
+
+    def load(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def describe(self) -> dict:
+        return {"backend": self.name, "records": len(self.records), "generation": self.generation}
+
+    def all_records(self) -> list:
+        return [dict(record) for record in self.records]
+
+    def query(self, embedding, n_results: int) -> list:
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        top = np.argsort(-scores)[:n_results]
+        return [dict(self.records[i]) for i in top]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = []
+        self.bulk_operations = 0
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+
+    @staticmethod
+    def _project(document: dict, projection: dict):
+        if not projection:
+            return dict(document)
+        included = {field for field, include in projection.items() if include}
+        return {field: value for field, value in document.items() if field in included}
+
+    async def find_one(self, filter: dict, projection: dict = None):
+        for document in self.documents:
+            if all(document.get(field) == value for field, value in filter.items()):
+                return self._project(document, projection)
+        return None
+
+    async def insert_one(self, document: dict):
+        self.documents.append(dict(document))
+        return SimpleNamespace(inserted_id=len(self.documents))
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_operations += len(operations)
+        return SimpleNamespace(bulk_api_result={})
+
+    async def create_index(self, keys, **kwargs):
+        name = kwargs.get("name", "index")
+        self.indexes[name] = {"key": [(keys, 1)] if isinstance(keys, str) else list(keys)}
+        return name
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._collections.setdefault(name, FakeCollection())
+
+
+def install_stand_ins(args, users: list):
+    """
+    Replaces the process-wide clients with the local stand-ins and returns them.
+    Must run before the app starts handling requests.
+    """
+    import chat_log_writer
+    import db as db_module
+    import llm_clients
+    import profile_cache
+    import utils
+    from corpus import load_corpus
+    from retrieval import retrieval_engine
+
+    fake_db = FakeDatabase()
+    for email in users:
+        fake_db.users.documents.append({
+            "email": email, "name": "مستخدم", "gender": "male", "profession": "",
+            "likes": [], "dislikes": [], "allergies": [], "favorite_recipes": [],
+        })
+    for module in (db_module, utils, profile_cache, chat_log_writer):
+        module.db = fake_db
+
+    chat_model = FakeChatModel(args.llm_latency, args.tokens_per_second, args.reply_tokens)
+    classifier = FakeGroq(args.classifier_latency)
+    llm_clients._chat_llm = chat_model
+    llm_clients._async_groq = classifier
+
+    if args.real_embeddings:
+        from sentence_transformers import SentenceTransformer
+        retrieval_engine.model = SentenceTransformer(retrieval_engine.model_name)
+    else:
+        retrieval_engine.model = HashingEmbedder()
+    recipes = list(load_corpus(args.corpus).values())
+    records = [{"title": recipe["title"], "document": recipe["document"]} for recipe in recipes]
+    matrix = np.asarray(
+        retrieval_engine.model.encode([record["document"] for record in records], convert_to_numpy=True),
+        dtype=np.float32,
+    )
+    retrieval_engine.backend = InMemoryBackend(records, matrix)
+
+    return SimpleNamespace(db=fake_db, chat_model=chat_model, classifier=classifier,
+                           titles=[record["title"] for record in records])
+
+
+def conversation_script(titles: list, rng: random.Random) -> list:
+    return [
+        ("greeting", GREETING),
+        ("dish_request", DISH_REQUEST.format(title=rng.choice(titles))),
+        ("choice", "1"),
+        ("follow_up", FOLLOW_UP),
+    ]
+
+
+async def exchange(ws, text: str):
+    """
+    Sends one message and waits for its final frame. Returns (frame, seconds to
+    the first frame, seconds to the final frame).
+    """
+    started = time.perf_counter()
+    first = None
+    await ws.send(text)
+    while True:
+        frame = json.loads(await ws.recv())
+        if first is None:
+            first = time.perf_counter() - started
+        if frame.get("type") in FINAL_FRAMES:
+            return frame, first, time.perf_counter() - started
+
+
+async def run_user(uri: str, email: str, args, titles: list, samples: dict, errors: list, seed: int):
+    import websockets
+    from auth import create_session_token
+
+    rng = random.Random(seed)
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    try:
+        async with websockets.connect(uri, max_size=None) as ws:
+            await ws.recv()  # auth_request
+            await ws.send(json.dumps({"token": create_session_token(email), "mode": "text", "stream": args.stream}))
+            session = json.loads(await ws.recv())
+            if session.get("type") != "session":
+                errors.append(f"{email}: {session.get('message', session)}")
+                return
+
+            for conversation in range(args.conversations):
+                if conversation:
+                    await exchange(ws, "/new")
+                got_suggestions = False
+                for kind, text in conversation_script(titles, rng):
+                    if kind == "choice" and not got_suggestions:
+                        continue
+                    frame, first, total = await exchange(ws, text)
+                    samples.setdefault(kind, []).append((first, total, frame["type"]))
+                    got_suggestions = frame["type"] == "suggestions"
+                    if args.think_time:
+                        await asyncio.sleep(rng.uniform(0, args.think_time))
+    except Exception as e:
+        errors.append(f"{email}: {e!r}")
+
+
+async def monitor_loop_lag(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50 * 1000, 1), "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1),
+            "max": round(max(values) * 1000, 1)}
+
+
+def build_report(args, samples: dict, errors: list, lags: list, elapsed: float, stand_ins) -> dict:
+    total_messages = sum(len(values) for values in samples.values())
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "duration_s": round(elapsed, 2),
+        "messages": total_messages,
+        "throughput_msg_s": round(total_messages / elapsed, 2) if elapsed else 0.0,
+        "errors": len(errors),
+        "unexpected": sum(
+            count for kind, values in samples.items()
+            for outcome, count in Counter(o for *_, o in values).items() if outcome != EXPECTED_OUTCOMES.get(kind, outcome)
+        ),
+        "error_samples": errors[:10],
+        "per_type": {
+            kind: {
+                "count": len(values),
+                "expected": EXPECTED_OUTCOMES.get(kind),
+                "outcomes": dict(Counter(o for *_, o in values)),
+                "latency_ms": percentiles([total for _, total, _ in values]),
+                "first_frame_ms": percentiles([first for first, _, _ in values]),
+            }
+            for kind, values in samples.items()
+        },
+        "event_loop_lag_ms": percentiles(lags),
+        "stand_ins": {
+            "llm_calls": stand_ins.chat_model.calls,
+            "classifier_calls": stand_ins.classifier.calls,
+            "chat_log_operations": stand_ins.db.chat_logs.bulk_operations,
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{report['messages']} messages in {report['duration_s']}s "
+          f"({report['throughput_msg_s']} msg/s), {report['errors']} errors, "
+          f"{report['unexpected']} unexpected replies")
+    print(f"{'type':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'1st p50':>10}")
+    for kind, stats in report["per_type"].items():
+        latency, first = stats["latency_ms"], stats["first_frame_ms"]
+        print(f"{kind:<14}{stats['count']:>7}{latency['p50']:>10}{latency['p95']:>10}"
+              f"{latency['p99']:>10}{latency['max']:>10}{first['p50']:>10}")
+    for kind, stats in report["per_type"].items():
+        unexpected = {o: n for o, n in stats["outcomes"].items() if o != (stats["expected"] or o)}
+        if unexpected:
+            print(f"  warning: {kind} expected {stats['expected']!r} frames, got {unexpected}")
+    lag = report["event_loop_lag_ms"]
+    print(f"event loop lag: p50 {lag['p50']} ms, p99 {lag['p99']} ms, max {lag['max']} ms")
+    for error in report["error_samples"]:
+        print(f"  error: {error}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(args) -> dict:
+    import uvicorn
+
+    users = [f"loadtest-{i}@example.com" for i in range(args.users)]
+    stand_ins = install_stand_ins(args, users)
+
+    from main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+
+    samples, errors, lags = {}, [], []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lags, stop))
+    uri = f"ws://127.0.0.1:{port}/ws/chat"
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            run_user(uri, email, args, stand_ins.titles, samples, errors, args.seed + i)
+            for i, email in enumerate(users)
+        ))
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+        server.should_exit = True
+        await server_task
+
+    return build_report(args, samples, errors, lags, elapsed, stand_ins)
+
+
+def main():
+    from corpus import CORPUS_DIR
+
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated users through /ws/chat.")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users.")
+    parser.add_argument("--conversations", type=int, default=2, help="Scripted conversations per user.")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Users start uniformly within this many seconds.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between messages.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake chat model time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake chat model token rate.")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Tokens in each fake reply.")
+    parser.add_argument("--classifier-latency", type=float, default=0.15, help="Fake classifier latency.")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Disable delta frames.")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the SentenceTransformer model.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Recipe files for the in-memory vector store.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    if args.real_embeddings:
+        os.environ.pop("HF_HUB_OFFLINE", None)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
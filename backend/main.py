@@ -1,17 +1,35 @@
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi import Request, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
-from utils import create_user, get_user_by_email, hash_password, verify_password, add_recipe_to_favourites, get_user_favourites_by_email, save_chat_log, get_user_chats, update_user_field
+from fastapi import Header
+from fastapi.responses import StreamingResponse, FileResponse, Response
+from db import ensure_indexes
+from utils import create_user, get_user_by_email, verify_password_async, add_recipe_to_favourites, get_user_favourites_by_email, get_user_chats, get_chat_log, update_user_field
+from utils import PROFILE_FIELDS, SESSION_FIELDS, LOGIN_FIELDS, EXISTS_FIELDS
 from fastapi.middleware.cors import CORSMiddleware
-from myChatBot import WebSocketBotSession
-from groq import Groq
-import io
+from auth import create_session_token, verify_session_token, resolve_email, SESSION_TOKEN_TTL, REQUIRE_SESSION_TOKEN
+from myChatBot import WebSocketBotSession, classification_cache, speculative_retrieval
+from retrieval import retrieval_engine
+from intent_fastpath import intent_fastpath
+from llm_clients import close_clients
+from stt import transcribe_upload, UploadTooLarge
+from chat_log_writer import chat_log_writer
+from profile_cache import profile_cache
+from session_registry import session_registry
+from prompts import prompt_token_report, render_user_context
+from token_count import load_tokenizer
+from observability import configure_logging, metrics_payload, stage, start_turn
+import asyncio
+import logging
 import wave
-from elevenlabs import ElevenLabs
+from tts import synthesize, synthesize_pipelined, start_stream, TTS_VOICE_ID, TTS_MODEL_ID, TTS_OUTPUT_FORMAT
+from tts_cache import tts_cache, TTS_CACHE_ENABLED
 import os
 from dotenv import load_dotenv
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 app.add_middleware(
@@ -22,17 +40,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-sessions = {}
-client = Groq(api_key=os.getenv("GROQ_API_KEY")) 
+@app.on_event("startup")
+async def startup():
+    # Load the embedding model in the background so the server accepts connections
+    # right away; /health reports when retrieval is warm.
+    app.state.retrieval_warmup = asyncio.create_task(retrieval_engine.warm_up())
+    intent_fastpath.load()
+    app.state.tokenizer_load = asyncio.create_task(asyncio.to_thread(load_tokenizer))
+    chat_log_writer.start()
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.warning("Could not create MongoDB indexes: %s", e)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await chat_log_writer.close()
+    await retrieval_engine.close()
+    await close_clients()
+
+@app.get("/health")
+async def health():
+    status = retrieval_engine.status()
+    if not status["ready"]:
+        raise HTTPException(status_code=503, detail=status)
+    return {"status": "ok", "retrieval": status, "classifier_cache": classification_cache.stats(),
+            "intent_fastpath": intent_fastpath.stats(), "speculative_retrieval": speculative_retrieval.stats(),
+            "chat_log_writer": chat_log_writer.stats(), "profile_cache": profile_cache.stats(),
+            "sessions": session_registry.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    content, content_type = metrics_payload()
+    return Response(content=content, media_type=content_type)
 
 @app.get("/get-chat-logs")
-async def get_chat_logs(email: str):
-    chats = await get_user_chats(email)
-    return {"chats": chats}
+async def get_chat_logs(email: str = None, cursor: str = None, limit: int = 20,
+                        authorization: str = Header(default="")):
+    email = resolve_email(authorization, email)
+    try:
+        return await get_user_chats(email, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@app.get("/get-chat-log/{chat_id}")
+async def get_single_chat_log(chat_id: str, email: str = None, authorization: str = Header(default="")):
+    email = resolve_email(authorization, email)
+    chat = await get_chat_log(email, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found.")
+    return chat
 
 @app.get("/get-profile")
-async def get_profile(email: str):
-    user = await get_user_by_email(email)
+async def get_profile(email: str = None, authorization: str = Header(default="")):
+    email = resolve_email(authorization, email)
+    user = await get_user_by_email(email, PROFILE_FIELDS)
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
     
@@ -44,9 +106,9 @@ async def get_profile(email: str):
     }
 
 @app.post("/update-profile")
-async def update_profile(request: Request):
+async def update_profile(request: Request, authorization: str = Header(default="")):
     data = await request.json()
-    email = data.get("email")
+    email = resolve_email(authorization, data.get("email"))
     field = data.get("field")  # likes, dislikes, allergies
     updated_list = data.get("updatedList")
 
@@ -83,7 +145,7 @@ async def signup(request: Request):
     for key, default in optional_fields.items():
         data[key] = data.get(key, default)
 
-    existing_user = await get_user_by_email(data["email"])
+    existing_user = await get_user_by_email(data["email"], EXISTS_FIELDS)
     if existing_user:
         raise HTTPException(status_code=409, detail="Email already registered")
 
@@ -100,22 +162,24 @@ async def login(request: Request):
     if not email or not password:
         raise HTTPException(status_code=400, detail="Email and password are required.")
 
-    user = await get_user_by_email(email)
+    user = await get_user_by_email(email, LOGIN_FIELDS)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password.")
 
-    if not verify_password(password, user["password"]):
+    if not await verify_password_async(password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password.")
 
     return {
         "message": "Login successful",
-        "email": user["email"]
+        "email": user["email"],
+        "token": create_session_token(user["email"]),
+        "expires_in": SESSION_TOKEN_TTL
     }
 
 @app.post("/add-favourite")
-async def add_favourite(request: Request):
+async def add_favourite(request: Request, authorization: str = Header(default="")):
     data = await request.json()
-    email = data.get("email")
+    email = resolve_email(authorization, data.get("email"))
     title = data.get("title")
     recipe = data.get("recipe")
 
@@ -128,18 +192,11 @@ async def add_favourite(request: Request):
 @app.post("/transcribe-audio")
 async def transcribe_audio(file: UploadFile = File(...)):
     try:
-        contents = await file.read()
-        wav_buffer = io.BytesIO(contents)
-        wav_buffer.name = "audio.wav"
-
-        transcription = client.audio.transcriptions.create(
-            file=wav_buffer,
-            model="whisper-large-v3-turbo",
-            language="ar",
-            response_format="verbose_json"
-        )
-
-        return {"text": transcription.text}
+        with stage("stt", mode="voice"):
+            text = await transcribe_upload(file)
+        return {"text": text}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
@@ -147,7 +204,8 @@ async def transcribe_audio(file: UploadFile = File(...)):
 import requests
 
 @app.get("/get-favourites")
-async def get_favourites(email: str):
+async def get_favourites(email: str = None, authorization: str = Header(default="")):
+    email = resolve_email(authorization, email)
     favourites = await get_user_favourites_by_email(email)
     if favourites is None:
         raise HTTPException(status_code=404, detail="User not found or no favorites.")
@@ -200,37 +258,165 @@ async def speak_text(request: Request):
         if not text:
             raise HTTPException(status_code=400, detail="Text is required.")
 
-        from elevenlabs import ElevenLabs
-        client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))  # 🔁 Replace this with your actual API key
-
-        audio = client.text_to_speech.convert(
-            voice_id="21m00Tcm4TlvDq8ikWAM",
-            output_format="mp3_44100_128",
-            text=text,
-            model_id="eleven_multilingual_v2"
-        )
+        cache_key = tts_cache.key(text, TTS_VOICE_ID, TTS_MODEL_ID, TTS_OUTPUT_FORMAT)
+        if TTS_CACHE_ENABLED:
+            cached_path = tts_cache.lookup(cache_key)
+            if cached_path:
+                return FileResponse(cached_path, media_type="audio/mpeg")
+
+        # "pipeline": synthesize sentence by sentence so the first one plays while
+        # the rest are still being generated.
+        if data.get("pipeline", False):
+            audio = synthesize_pipelined(text)
+        else:
+            audio = synthesize(text)
+
+        # Measured up to the first audio chunk, which is what the listener waits for.
+        with stage("tts", mode="voice"):
+            audio = await start_stream(audio)
+        if TTS_CACHE_ENABLED:
+            audio = tts_cache.tee(cache_key, audio)
+        return StreamingResponse(audio, media_type="audio/mpeg")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("TTS generation failed")
+        raise HTTPException(status_code=500, detail=f"TTS generation failed: {str(e)}")
 
-        import io
-        audio_bytes = b"".join(audio)  # convert generator to bytes
-        audio_stream = io.BytesIO(audio_bytes)
 
-        audio_stream.seek(0)
+def check_admin_token(token: str):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or token != admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
+@app.get("/admin/tts-cache")
+async def tts_cache_stats(x_admin_token: str = Header(default="")):
+    check_admin_token(x_admin_token)
+    return tts_cache.stats()
+
+
+@app.get("/admin/sessions")
+async def sessions_stats(x_admin_token: str = Header(default="")):
+    check_admin_token(x_admin_token)
+    return session_registry.stats(per_session=True)
+
+
+@app.get("/admin/prompt-tokens")
+async def prompt_tokens(email: str = None, mode: str = "text", x_admin_token: str = Header(default="")):
+    """
+    Token count of each system prompt section, for a given user or a blank profile.
+    """
+    check_admin_token(x_admin_token)
+    user = await get_user_by_email(email, SESSION_FIELDS) if email else None
+    user = user or {}
+    user_context = render_user_context(
+        name=user.get("name", ""),
+        gender=user.get("gender", "male"),
+        profession=user.get("profession"),
+        likes=user.get("likes", []),
+        dislikes=user.get("dislikes", []),
+        allergies=user.get("allergies", []),
+        favorite_recipes=user.get("favorite_recipes", []),
+        mode=mode,
+    )
+    return prompt_token_report(user_context=user_context)
+
+
+@app.post("/admin/tts-cache/warm")
+async def warm_tts_cache(request: Request, x_admin_token: str = Header(default="")):
+    check_admin_token(x_admin_token)
+    data = await request.json()
+    texts = [text.strip() for text in data.get("texts", []) if text and text.strip()]
+    semaphore = asyncio.Semaphore(4)
+
+    async def warm(text):
+        key = tts_cache.key(text, TTS_VOICE_ID, TTS_MODEL_ID, TTS_OUTPUT_FORMAT)
+        if tts_cache.contains(key):
+            return "cached"
+        async with semaphore:
+            try:
+                async for _ in tts_cache.tee(key, synthesize(text)):
+                    pass
+                return "synthesized"
+            except Exception as e:
+                logger.warning("TTS cache warm-up failed for %r: %s", text[:30], e)
+                return "failed"
+
+    outcomes = await asyncio.gather(*(warm(text) for text in texts))
+    return {
+        "requested": len(texts),
+        "synthesized": outcomes.count("synthesized"),
+        "already_cached": outcomes.count("cached"),
+        "failed": outcomes.count("failed"),
+        "cache": tts_cache.stats(),
+    }
 
-        return StreamingResponse(audio_stream, media_type="audio/mpeg")
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()  # 👈 prints full error in console
-        raise HTTPException(status_code=500, detail=f"TTS generation failed: {str(e)}")
+def build_session(user_data: dict, user_email: str, mode: str) -> WebSocketBotSession:
+    session = WebSocketBotSession()
+    session.set_user_info(
+        name=user_data.get("name", ""),
+        gender=user_data.get("gender", "male"),
+        profession=user_data.get("profession", None),
+        likes = user_data.get("likes", []),
+        dislikes = user_data.get("dislikes", []),
+        allergies = user_data.get("allergies", []),
+        favorite_recipes = user_data.get("favorite_recipes", []),
+    )
+    session.user_email = user_email
+    session.set_mode(mode)  # Set the mode (text or voice)
+    return session
 
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("🟢 WebSocket connection established.")
+    logger.debug("WebSocket connection established.")
 
-    session = WebSocketBotSession()
-    session.chat_history = []
+    # The session lives in the registry so that a reconnect with the same session_id
+    # resumes it. Turns are handed to the write-behind logger as they happen and land
+    # in the chat_logs document entry.chat_id; a new conversation gets a new document.
+    entry = None
+
+    def log_turn(sender, text):
+        chat_log_writer.append(entry.chat_id, entry.email, sender, text)
+
+    async def respond(user_message):
+        if session.expecting_choice:
+            try:
+                selected_index = int(user_message.strip()) - 1
+
+                # ✅ Append the original query only if stored
+                if session.last_user_query:
+                    log_turn("user", session.last_user_query)
+                    session.last_user_query = None  # reset after logging
+
+                # ✅ Append the user's choice
+                log_turn("user", user_message)
+
+                result = await session.handle_choice(selected_index, on_delta)
+
+                if result["type"] == "response":
+                    log_turn("bot", result["message"])
+
+            except (ValueError, IndexError):
+                result = {
+                    "type": "error",
+                    "message": "من فضلك اختر رقم من الاختيارات الموجودة."
+                }
+
+        else:
+            result = await session.handle_message(user_message, on_delta)
+
+            # ✅ Only append here if NOT expecting a follow-up choice
+            if result["type"] == "suggestions":
+                session.last_user_query = user_message  # store temporarily for next choice
+            else:
+                log_turn("user", user_message)
+                log_turn("bot", result["message"])
+        return result
 
     try:
         # Step 1: Wait for email (identifier)
@@ -240,51 +426,75 @@ async def websocket_endpoint(websocket: WebSocket):
         })
 
         login_info = await websocket.receive_json()
-        user_email = login_info.get("email", "").strip()
-        mode = login_info.get("mode", "text")
-
-        user_data = await get_user_by_email(user_email)
-        if not user_data:
+        # A session token from /login is verified locally; the raw email is the
+        # legacy fallback.
+        token = login_info.get("token")
+        user_email = verify_session_token(token) if token else login_info.get("email", "").strip()
+        if (token and not user_email) or (not token and REQUIRE_SESSION_TOKEN):
             await websocket.send_json({
                 "type": "error",
-                "message": "المستخدم غير موجود. من فضلك سجل أولاً."
+                "message": "انتهت صلاحية الجلسة. من فضلك سجل الدخول مرة أخرى."
             })
             await websocket.close()
             return
+        mode = login_info.get("mode", "text")
+        stream = bool(login_info.get("stream", False))
+
+        async def send_delta(text):
+            await websocket.send_json({"type": "delta", "delta": text})
+
+        # In streaming mode the reply is sent as "delta" frames while it is generated,
+        # followed by the usual "response" frame with the full message.
+        on_delta = send_delta if stream else None
+
+        session_id = login_info.get("session_id")
+        entry = session_registry.resume(user_email, session_id) if session_id else None
+        resumed = entry is not None
+        if resumed:
+            logger.info("Resumed chat session", extra={"session_id": entry.session_id})
+            session = entry.session
+            if session.mode != mode:
+                session.set_mode(mode)
+        else:
+            with stage("auth_lookup", mode=mode):
+                user_data = await get_user_by_email(user_email, SESSION_FIELDS)
+            if not user_data:
+                await websocket.send_json({
+                    "type": "error",
+                    "message": "المستخدم غير موجود. من فضلك سجل أولاً."
+                })
+                await websocket.close()
+                return
+
+            # Step 2: Use user data from DB to set session
+            session = build_session(user_data, user_email, mode)
+            entry = session_registry.create(user_email, session, chat_log_writer.new_chat_id())
+
+        # A reconnect can arrive before the old connection is noticed as dropped;
+        # the newest connection takes the session over.
+        previous, entry.websocket = entry.websocket, websocket
+        if previous is not None:
+            try:
+                await previous.close(code=4000)
+            except Exception:
+                pass
 
-        # Step 2: Use user data from DB to set session
-        session.set_user_info(
-            name=user_data.get("name", ""),
-            gender=user_data.get("gender", "male"),
-            profession=user_data.get("profession", None),
-            likes = user_data.get("likes", []),
-            dislikes = user_data.get("dislikes", []),
-            allergies = user_data.get("allergies", []),
-            favorite_recipes = user_data.get("favorite_recipes", []),
-        )
-
-        session.user_email = user_email  # (optional for future reference)
-        session.set_mode(mode)  # Set the mode (text or voice)
-        session._update_system_prompt()
+        await websocket.send_json({
+            "type": "session",
+            "session_id": entry.session_id,
+            "resumed": resumed,
+            "suggestions": session.suggestions if session.expecting_choice else [],
+        })
 
         # Step 3: Start the chat loop
         while True:
             user_message = await websocket.receive_text()
-            print(f"\n📨 Incoming WebSocket message: {user_message}")
 
             # Check for reset command
             if user_message.strip() == "/new":
-                session = WebSocketBotSession()  # Reset session completely
-                session.set_user_info(
-                    name=user_data.get("name", ""),
-                    gender=user_data.get("gender", "male"),
-                    profession=user_data.get("profession", None),
-                    likes = user_data.get("likes", []),
-                    dislikes = user_data.get("dislikes", []),
-                    allergies = user_data.get("allergies", []),
-                    favorite_recipes = user_data.get("favorite_recipes", [])
-                )
-                session.user_email = user_email
+                user_data = await get_user_by_email(user_email, SESSION_FIELDS) or {}
+                session = build_session(user_data, user_email, mode)  # Reset session completely
+                session_registry.replace_session(entry, session, chat_log_writer.new_chat_id())
 
                 await websocket.send_json({
                     "type": "reset",
@@ -293,51 +503,20 @@ async def websocket_endpoint(websocket: WebSocket):
 
                 continue
 
-            if session.expecting_choice:
-                try:
-                    selected_index = int(user_message.strip()) - 1
-
-                    # ✅ Append the original query only if stored
-                    if session.last_user_query:
-                        session.chat_history.append({"sender": "user", "text": session.last_user_query})
-                        session.last_user_query = None  # reset after logging
-
-                    # ✅ Append the user's choice
-                    session.chat_history.append({"sender": "user", "text": user_message})
-
-                    result = await session.handle_choice(selected_index)
-
-                    if result["type"] == "response":
-                        session.chat_history.append({"sender": "bot", "text": result["message"]})
-
-                except (ValueError, IndexError):
-                    result = {
-                        "type": "error",
-                        "message": "من فضلك اختر رقم من الاختيارات الموجودة."
-                    }
-
-            else:
-                result = await session.handle_message(user_message)
-
-                # ✅ Only append here if NOT expecting a follow-up choice
-                if result["type"] == "suggestions":
-                    session.last_user_query = user_message  # store temporarily for next choice
-                else:
-                    session.chat_history.append({"sender": "user", "text": user_message})
-                    session.chat_history.append({"sender": "bot", "text": result["message"]})
-
-
-
+            turn = start_turn(mode)
+            try:
+                result = await respond(user_message)
+            except Exception:
+                turn.finish("error")
+                raise
+            turn.finish(result["type"])
 
+            session_registry.touch(entry)
             await websocket.send_json(result)
-            # if result["type"] == "response":
-            #     session.chat_history.append({"sender": "user", "text": user_message})
-            #     session.chat_history.append({"sender": "bot", "text": result["message"]})
-
-            print("📤 Response sent to frontend.\n")
 
     except WebSocketDisconnect:
-         print("🔴 WebSocket disconnected.")
-         if session.chat_history:
-            await save_chat_log(user_email, session.chat_history)
+         logger.debug("WebSocket disconnected.")
+    finally:
+        if entry is not None:
+            session_registry.release(entry, websocket)
         
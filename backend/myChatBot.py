@@ -1,57 +1,45 @@
-from langchain.chains import LLMChain
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
 from langchain_core.messages import SystemMessage
-from langchain.chains.conversation.memory import ConversationBufferWindowMemory
-from langchain_groq import ChatGroq
-import chromadb
-from chromadb.utils import embedding_functions
-from groq import Groq
-from datetime import datetime
+from groq import APIError
+from llm_clients import get_async_groq, get_chat_llm, CHAT_MODEL, CLASSIFIER_MODEL, CLASSIFIER_TIMEOUT, LLM_TIMEOUT
+from retrieval import retrieval_engine
+from intent_fastpath import intent_fastpath, INTENT_FASTPATH_ENABLED
+from speculation import SpeculativeRetrieval, SPECULATIVE_RETRIEVAL_ENABLED
+from arabic_text import normalize_arabic
+from cache import TTLLRUCache
+from conversation_memory import BudgetedConversationMemory
+from observability import stage
+from prompts import render_user_context, build_system_prompt, prompt_token_report
+import asyncio
+import hashlib
+import logging
 import os
+import sys
 
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_CACHE_MAXSIZE = int(os.getenv("CLASSIFIER_CACHE_MAXSIZE", "2048"))
+CLASSIFIER_CACHE_TTL = float(os.getenv("CLASSIFIER_CACHE_TTL", "1800"))
+
+classification_cache = TTLLRUCache(CLASSIFIER_CACHE_MAXSIZE, CLASSIFIER_CACHE_TTL)
+speculative_retrieval = SpeculativeRetrieval(retrieval_engine)
+SESSION_BASE_BYTES = 4096  # the session object and its bookkeeping, excluding text
+NO_RETRIEVAL_LABELS = ["not food related", "respond based on chat history", "food generalized"]
 
 
 def retrieve_data(query):
     """
-    Retrieves top matching recipes from ChromaDB and returns both titles and documents.
+    Retrieves top matching recipes from the shared retrieval engine and returns both titles and documents.
     """
-    chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
-    model_name = "akhooli/Arabic-SBERT-100K"
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
-
-    try:
-        collection = chroma_client.get_collection("recipestest", embedding_function=sentence_transformer_ef)
-        print("Collection 'recipestest' found.")
-    except chromadb.errors.InvalidCollectionException:
-        print("Collection 'recipestest' does not exist. Please add data first.")
-        return []
-
-    results = collection.query(
-        query_texts=[query],
-        n_results=5,
-        include=["documents", "metadatas"]  # Correct: include metadatas, not ids.
-    )
-
-    print("🔍 Raw ChromaDB Results:", results)
-
-    structured_results = []
-    for doc, metadata in zip(results["documents"][0], results["metadatas"][0]):
-        structured_results.append({
-            "title": metadata.get("title", "وصفة بدون عنوان"),
-            "document": doc
-        })
-
-
-    return structured_results
+    return retrieval_engine.search(query)
 
 
 
-def enhance_query_with_groq(query, chat_context=""):
+async def enhance_query_with_groq(query, chat_context=""):
     """
     This function uses the Groq API to enhance the query and determine if it's food-related.
     """
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    client = get_async_groq()
     system_prompt = """
 أنت مراقب لتحليل المحادثة بين المستخدم والروبوت، وهدفك هو تصنيف كل موقف بدقة لتحديد ما إذا كان يجب تنفيذ استرجاع لوصفة طعام.
 
@@ -188,21 +176,65 @@ def enhance_query_with_groq(query, chat_context=""):
         رسالة المستخدم الحالية:
         {query}
         """
-    print("Full Input to query enhancer/classifier:", full_input)
+    logger.debug("Classifier input: %s", full_input)
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": full_input},
     ]
 
-    chat_completion = client.chat.completions.create(
+    chat_completion = await client.chat.completions.create(
         messages=messages,
-        model="meta-llama/llama-4-maverick-17b-128e-instruct",  # Change to appropriate model for query enhancement
+        model=CLASSIFIER_MODEL,
         temperature=0.0,
+        timeout=CLASSIFIER_TIMEOUT,
     )
 
     return chat_completion.choices[0].message.content
 
 
+def classification_cache_key(query, chat_context=""):
+    """
+    Cache key for the classifier: the normalized message plus a fingerprint of the
+    normalized recent chat context.
+    """
+    context_hash = hashlib.sha1(normalize_arabic(chat_context).encode("utf-8")).hexdigest()
+    return (normalize_arabic(query), context_hash)
+
+
+def cached_classification(query, chat_context=""):
+    cached = classification_cache.get(classification_cache_key(query, chat_context))
+    if cached is not None:
+        logger.debug("Classifier cache hit: %s", cached)
+    return cached
+
+
+async def classify_query(query, chat_context="", check_cache=True):
+    """
+    Memoized enhance_query_with_groq. A cache hit skips the remote call completely.
+    Callers that already looked the query up pass check_cache=False, so the miss is
+    not counted twice.
+    """
+    if check_cache:
+        cached = cached_classification(query, chat_context)
+        if cached is not None:
+            return cached
+    key = classification_cache_key(query, chat_context)
+
+    try:
+        result = await asyncio.wait_for(
+            enhance_query_with_groq(query, chat_context=chat_context), CLASSIFIER_TIMEOUT
+        )
+    except Exception as e:
+        # Without a classification, answer from the conversation without retrieval.
+        logger.warning("Classifier call failed, skipping retrieval: %r", e)
+        return "respond based on chat history"
+
+    result = result.strip()
+    if result:
+        classification_cache.set(key, result)
+    return result
+
+
 
 def choose_from_suggestions(suggestions_string: str) -> str:
     """
@@ -236,7 +268,7 @@ def select_suggestion_from_list(suggestions_string: str) -> list:
 
 class WebSocketBotSession:
     def __init__(self):
-        self.memory = ConversationBufferWindowMemory(k=12, memory_key="chat_history", return_messages=True)
+        self.memory = BudgetedConversationMemory()
         self.expecting_choice = False
         self.suggestions = []
         self.original_question = ""
@@ -244,11 +276,15 @@ class WebSocketBotSession:
         self.user_gender = None
         self.user_profession = None 
         self.mode = None
+        self.user_likes = []
+        self.user_dislikes = []
+        self.user_allergies = []
+        self.user_favorite_recipes = []
+        self.user_context = ""
         self.retrieved_documents = {}  # Holds full recipes keyed by title
         self.last_user_query = None
-        self.groq_api_key = os.getenv("GROQ_API_KEY")
-        self.model = 'meta-llama/llama-4-maverick-17b-128e-instruct'
-        self.groq_chat = ChatGroq(groq_api_key=self.groq_api_key, model_name=self.model)
+        self.model = CHAT_MODEL
+        self.groq_chat = get_chat_llm()  # Shared across sessions
 
     def set_user_info(self, name: str, gender: str, profession: str = None, likes: list = None, dislikes: list = None, allergies: list = None, favorite_recipes: list = None):
         self.user_name = name
@@ -266,172 +302,73 @@ class WebSocketBotSession:
 
 
     def get_recent_chat_context(self, n=10):
-        history = self.memory.load_memory_variables({})["chat_history"]
-        return "\n".join(
-            f"{m.type}: {m.content}" for m in history[-n:]
-        )
-
-    def _update_system_prompt(self):
-    
-        if self.user_profession:
-            profession = self.user_profession.strip().lower()
-            if "مهندس" in profession:
-                title = "بشمهندس" if self.user_gender == "male" else "بشمهندسه"
-            elif "دكتور" in profession:
-                title = "دكتور" if self.user_gender == "male" else "دكتوره"
-            else:
-                title = self.user_profession
-        else:
-            title = "أستاذ" if self.user_gender == "male" else "أستاذة"
-        
-        likes_str = "، ".join(self.user_likes) if self.user_likes else "لا يوجد"
-        dislikes_str = "، ".join(self.user_dislikes) if self.user_dislikes else "لا يوجد"
-        allergies_str = "، ".join(self.user_allergies) if self.user_allergies else "لا يوجد"
-        favorites_titles = [fav["title"] for fav in self.user_favorite_recipes] if self.user_favorite_recipes else []
-        favorites_str = "، ".join(favorites_titles) if favorites_titles else "لا يوجد"
-        now = datetime.now()
-        current_time = now.strftime("%H:%M")
-        current_date = now.strftime("%Y-%m-%d")
-
-        core_prompt = f"""
-
-        أنت روبوت دردشة ذكي وودود ولديك حس فكاهي خفيف، وتهتم فقط بالطعام. تتحدث بالكامل باللغة العربية، وبالتحديد باللهجة المصرية.
-المستخدم الذي تتحدث معه هو: {title} {self.user_name}.
-يجب أن تناديه بشكل طبيعي بلقبه أو باسمه في بداية المحادثة أو في لحظات مناسبة فقط، دون الإكثار أو التكرار غير الطبيعي.
-المستخدم {self.user_gender}.
-حافظ دائما على مخاطبة المستخدم حسب هو ذكر ام انثى.
-هذا هو ملخص معلومات المستخدم:
-  "الأكلات المفضلة": {likes_str}
-  "الأكلات غير المفضلة": {dislikes_str}
-  "الحساسيات الغذائية": {allergies_str}
-  "الوصفات المفضله لدى المستخدم فى المحادثات السابقة": {favorites_str}
-يجب أن تأخذ هذه المعلومات في الاعتبار عند اقتراح الوصفات أو الأكلات و عند التفاعل مع المستخدم و يجب ان يكون استخدامهم منطقى.
-.يجب التشديد على الحساسيات الغذائية، حيث يجب تجنب او عرض بدائل أي مكونات أو أكلات تحتوي على مكونات تسبب حساسية للمستخدم 
-
-المحادثة الان هي: {self.mode}
-اذا كانت المحادثة voice :
- تعليمات خاصة بنمط المحادثة الصوتية:
-
-- يجب أن تكون جميع الردود **موجزة وواضحة ومباشرة**.
-- لا تطرح أكثر من سؤال في نفس الرسالة.
-- استخدم **اللغة العربية بالتشكيل الكامل** لتسهيل النطق عبر نموذج تحويل النص إلى كلام.
-- إذا تم استرجاع وصفة، **لا تُعرض الوصفة كاملة**، بل قدم **ملخصًا بسيطًا جدًا** عنها في سطر أو سطرين فقط يوضح اسم الأكلة وطريقة التحضير العامة.
-- تَجنّب التفاصيل الطويلة أو القوائم أو الخطوات الكثيرة في الردود.
-
-هدفك في هذا النمط هو أن تكون الردود مناسبة للاستماع السريع، دون تشويش أو تعقيد، وبطريقة تسهّل قراءتها صوتيًا للمستخدم.
-
-
-معلومة عن الألقاب:
-إذا كان المستخدم مهندسًا (مثال: مهندس أو مهندسة)، من الشائع في اللهجة المصرية مناداته بـ "بشمهندس" أو "يا هندسة" بطريقة ودودة. 
-يمكنك استخدام "بشمهندس {self.user_name}" أو فقط "يا هندسة" في بداية الحديث أو عند التعليق، ولكن لا تفرط في الاستخدام.
-نفس القاعدة تنطبق على الأطباء ("دكتور" أو "يا دكتور").
-
-ممنوع منعا باتا الاختلاط فى لقب او نوع المستخدم.
-استخدم الاكلات المفضله لدى المستخدم فى اقراحاتك و لكن لا تستخدمهم تحديدا و استخدم النوعية او الاكلات المشابهة بشكل عام.
-
-
-يجب أن تستفيد من الوقت الحالي في المحادثة عند تقديم المقترحات، و تذكر أن الوقت الحالي هو: {current_time}، و التاريخ هو: {current_date}.
-استخدام الوقت الحالى سيساعدك في تقديم اقتراحات ملائمة للمستخدم، مثل اقتراح وجبات خفيفة أو أكلات سريعة أو الإفطار أو الغداء أو العشاء، حسب الوقت الحالي.
-
-تعليمات خاصة لكبار السن:
-- تحدث بنبرة هادئة ومحترمة دائمًا.
-- لا تستخدم لغة تقنية أو مصطلحات معقدة.
-- اجعل الردود قصيرة ومباشرة وسهلة الفهم.
-- إذا شعرت أن المستخدم أكبر سنًا، كن صبورًا وأعد التوضيح عند الحاجة.
-
-عن نبرة الصوت:
-- إذا كانت النبرة ودودة، تجاوب بحماس ودفء.
-- إذا كانت النبرة غاضبة أو منزعجة، لا تعتذر فورًا، بل حاول تحويل الانفعال إلى مزاح خفيف محترم.
-  مثل: "شكل حضرتك زعلان، بس أراهن إن الوصفة دي هتصلّح المزاج!"
-  أو: "طب اديني فرصة أثبتلك إن الموضوع يستاهل... لو مطلعتش لذيذة، حقك عليّا!"
-
-عن الشخصية:
-- إذا كان المستخدم حازمًا، كن مباشرًا وفعالًا.
-- إذا كان المستخدم مترددًا، اقترح بلطف وادعمه في اتخاذ القرار.
-- إذا كان المستخدم يحب المزاح، رد عليه بخفة دم، دون مبالغة أو تهريج.
-
-ممنوع تمامًا:
-- لا تخترع وصفات أو تتحدث عن وصفات غير موجودة.
-- لا تفترض وجود صنف إذا لم يتم استرجاعه من قاعدة البيانات.
-- لا تقدم اقتراحات عامة عن الطعام إذا لم يتم طلبها بوضوح.
--
-يُمنع منعًا باتًا ذكر أسماء وصفات دقيقة أو محددة مثل كشري بالعدس أو بيتزا مارجريتا أو لازانيا السبانخ أو أي وصفة بعينها. يجب أن تقتصر الاقتراحات فقط على أنواع عامة من الأطعمة أو مكوناتها مثل دجاج، لحم، مكرونة، أرز، شوربة، سلطات، مأكولات بحرية، خضروات، معجنات، حلويات، مشروبات، عصائر، أو غيرها. عليك أن تكون مبدعًا في اقتراح أنواع طعام عامة تناسب سياق المحادثة بدون التقيد بالأمثلة المذكورة هنا، ولكن تحت أي ظرف، لا تذكر وصفة كاملة أو اسم أكلة محددة. يجب أن تبقى الاقتراحات عامة وشاملة لضمان التوافق مع قاعدة البيانات وعدم افتراض وجود وصفة معينة بالاسم. إذا شعرت أن المستخدم يحتاج إلى اقتراح، استخدم مصطلحات عامة جدًا للطعام، مع الحفاظ على أسلوب طبيعي ومرن يناسب سير المحادثة.
-إذا لم تتطابق الوصفات المسترجعة مع نية المستخدم، أخبره بلطافة:
-- مثلًا: "النوع ده مش موجود حاليًا، ممكن توضح أكتر تحب تاكل إيه؟"
-- ثم وجّه الحديث بشكل طبيعي حتى يعبر المستخدم عن طلب واضح لوصفة أو نوع أكل.
-
-هدفك الأساسي:
-أن يعبر المستخدم بوضوح عن وصفة أو نوع أكل يريده، لتقوم المنظومة بجلب الوصفة الدقيقة له من قاعدة البيانات.
-
-مهامك:
-- ابدأ الحديث بلقب المستخدم بشكل طبيعي (في أول سطر فقط أو عند الحاجة).
-- إذا قال المستخدم شيئًا مثل "إزيك" أو "مساء الخير"، رد عليه بلطافة بدون الحديث عن الأكل.
-- لا تقترح وصفات بنفسك. انتظر معزز الاستعلام ليحدد نية المستخدم.
-- إذا تم استرجاع وصفة، اعرضها فورا كما هي دون تعديل أو تلخيص و يجب عليك عرضها كاملة.
-- اعرض الوصفه المسترجعه كما هى بالتشكيل.
-- احرص على مخاطبة المستخدم حسب نوعه (ذكر ام انثى) فى تعليمات الوصفه
-
-إرشادات السلوك:
-- لا تكرر اسم المستخدم أو لقبه كثيرًا هذا امر هام جدا
-- استخدم الألقاب المناسبة فقط عند الحاجة (بشمهندس، يا دكتور، يا استاذ...).
-- لا تكرر نفسك أو تتحدث بأسلوب روبوتي.
-- إذا لم يفهم المستخدم أو كان غامضًا، وجّهه بلطافة لسؤاله عن الأكل.
-
-تسلسل النظام:
-1. حيّي المستخدم باسمه أو لقبه بطريقة طبيعية.
-2. لا تقترح طعامًا إلا إذا طلب المستخدم وصفة أو نوع أكل بوضوح.
-3. إذا ظهرت اقتراحات، انتظر اختيار المستخدم.
-4. عندما تُسترجع وصفة، اعرضها كما هي دون تعديل.
-5. إذا لم توجد وصفة مناسبة، اطلب من المستخدم توضيح رغبته.
-6. استمر في الحديث بنبرة طبيعية، خفيفة، وودية.
-
-ملحوظه هامه جدا جدا
-- اعرض الوصفه المسترجعه كما هى بالتشكيل.
-- تعامل مع المستخم حسب نوعه (ذكر ام انثى) فى تعليمات الوصفه
-- اذا كانت الوصفة المسترجعه مكتوبه بصيغة المؤنث يجب تعديلها لتناسب المستخدم الذكر.
-- اذا كانت المحادثة voice يجب ان تكون الوصفة مختصرة جدا و كل.
-إذا كانت المحادثة صوتية (voice mode)، يجب أن تكون جميع الردود باللهجة المصرية، مكتوبة بالعربية مع التشكيل الكامل بطريقة تُساعِد على النُطق الصّحيح.
-
- استخدم التشكيل لتوضيح النُطق، حتى وإن لم يكن التشكيل فُصحى رسمي.
- التزم بالتشكيل في كل الكلمات، كما تُقال باللهجة المصرية.
- لا تَكتب الردود بدون تشكيل أبدًا في هذا النمط.
-
-مثال: "إزَّاي أَقدَر أَساعِدَك؟" أو "طَب خُد الوَصفَة دي!"
-- يجب ان يكون استخدام الاكلات المفضله لدى المستخدم منطقى و ليس بشكل عشوائى و يكون استخدامهم بشكل عام و ليس بشكل محدد.
-- لا تخلط ابدا بين المحادثة ال voice و المحادثة ال text.
-- لا تخلط ابدا فى الالقاب و لا نوع المستخدم.
-
-كن عفويًا، صادقًا، ومتعاونًا، والهدف دائمًا أن تساعد المستخدم في اختيار وصفة حقيقية من قاعدة البيانات.
-"""
+        return self.memory.recent_context(n)
 
+    def footprint(self) -> int:
+        """
+        Approximate bytes held by this session: the conversation, the pending
+        suggestions and the retrieved recipes.
+        """
+        texts = [self.user_context, self.original_question, self.last_user_query, self.memory.summary]
+        texts += self.suggestions
+        texts += self.retrieved_documents.keys()
+        texts += self.retrieved_documents.values()
+        for turn in self.memory.turns:
+            texts += [turn.human, turn.ai]
+        return SESSION_BASE_BYTES + sum(sys.getsizeof(text) for text in texts if text)
 
-        self.system_prompt = core_prompt.strip()
+    def _update_system_prompt(self):
+        # Only the small per-user block is rendered here; the static prompt is shared
+        # by every session and the time is added per turn in _generate_response.
+        self.user_context = render_user_context(
+            name=self.user_name,
+            gender=self.user_gender,
+            profession=self.user_profession,
+            likes=self.user_likes,
+            dislikes=self.user_dislikes,
+            allergies=self.user_allergies,
+            favorite_recipes=self.user_favorite_recipes,
+            mode=self.mode,
+        )
 
-    async def handle_message(self, user_input: str):
-        print(f"\n🟡 Received user message: {user_input}")
+    async def handle_message(self, user_input: str, on_delta=None):
+        logger.debug("Received user message: %s", user_input)
         self.original_question = user_input
 
         recent_context = self.get_recent_chat_context(n=10)
-        query_result = enhance_query_with_groq(user_input, chat_context=recent_context)
-
-        print(f"🧠 Query Enhancer Output:\n{query_result}\n")
-
-        if query_result in ["not food related", "respond based on chat history","food generalized"]:
-            print("🔍 Passing message directly to LLM without retrieval.\n")
-            return await self._generate_response(user_input, query_result)
-
-        documents = retrieve_data(query_result)
+        speculative = {}
+        query_result = intent_fastpath.classify(user_input) if INTENT_FASTPATH_ENABLED else None
+        if query_result is not None:
+            logger.debug("Intent fast path answered without calling the classifier.")
+        else:
+            query_result = cached_classification(user_input, recent_context)
+        if query_result is None:
+            if SPECULATIVE_RETRIEVAL_ENABLED:
+                # Search on the raw message while the remote classifier is running.
+                speculative = speculative_retrieval.start(user_input)
+            with stage("classification"):
+                query_result = await classify_query(user_input, chat_context=recent_context, check_cache=False)
+
+        logger.info("Query classified", extra={"classification": query_result})
+
+        if query_result in NO_RETRIEVAL_LABELS:
+            if speculative:
+                speculative_retrieval.discard(speculative)
+            logger.debug("Passing message directly to LLM without retrieval.")
+            return await self._generate_response(user_input, query_result, on_delta)
+
+        documents = await speculative_retrieval.resolve(speculative, query_result) if speculative else None
+        if documents is None:
+            documents = await retrieval_engine.asearch(query_result)
         if not documents:
-            print("⚠️ No documents found. Responding with fallback.")
-            return await self._generate_response(user_input, "لم أتمكن من العثور على وصفات مناسبة.")
+            logger.info("No documents found. Responding with fallback.")
+            return await self._generate_response(user_input, "لم أتمكن من العثور على وصفات مناسبة.", on_delta)
 
         self.suggestions = [doc["title"] for doc in documents] + ["❌ لا أريد أي من هذه الخيارات"]  # Use titles as suggestions
         self.retrieved_documents = {doc["title"]: doc["document"] for doc in documents}
         self.expecting_choice = True
 
-        print("📋 Recipe Titles Found:")
-        for i, title in enumerate(self.suggestions, 1):
-            print(f"{i}. {title}")
+        logger.info("Recipe suggestions", extra={"titles": self.suggestions[:-1]})
 
         return {
             "type": "suggestions",
@@ -439,69 +376,104 @@ class WebSocketBotSession:
             "suggestions": self.suggestions
         }
 
-    async def handle_choice(self, choice_index: int):
-        print(f"🟠 User selected choice index: {choice_index}")
+    async def handle_choice(self, choice_index: int, on_delta=None):
+        logger.debug("User selected choice index %d", choice_index)
         # Check if user chose to skip suggestions
         if choice_index == len(self.suggestions) - 1:
-            print("🚫 User rejected all suggestions.")
+            logger.debug("User rejected all suggestions.")
             self.expecting_choice = False
             self.suggestions = []
-            return await self._generate_response(self.original_question, "لم يتم اختيار أي وصفة. يمكنك التحدث بحرية الآن.")
+            return await self._generate_response(self.original_question, "لم يتم اختيار أي وصفة. يمكنك التحدث بحرية الآن.", on_delta)
 
         if 0 <= choice_index < len(self.suggestions):
             selected_title = self.suggestions[choice_index]
-            print(f"✅ Selected Recipe Title: {selected_title}")
+            logger.info("Recipe selected", extra={"title": selected_title})
 
             retrieved_data = self.retrieved_documents[selected_title]
-            print(f"📦 Retrieved Full Recipe:\n{retrieved_data}\n")
 
             self.expecting_choice = False
             self.suggestions = []  # 🛠️ ADD THIS to clear suggestions safely
 
-            response = await self._generate_response(self.original_question, retrieved_data)
+            response = await self._generate_response(
+                self.original_question, retrieved_data, on_delta, recipe_title=selected_title
+            )
             response["selected_title"] = selected_title  # ✅ Good
             response["full_recipe"] = retrieved_data     # 🛠️ ADD THIS line to send the full recipe text
 
             return response
 
         else:
-            print("❌ Invalid choice index received.")
+            logger.debug("Invalid choice index received.")
             return {
                 "type": "error",
                 "message": "اختيار غير صالح. حاول رقم تاني."
             }
 
     
-    async def _generate_response(self, user_input: str, retrieved_data: str):
+    async def _stream_response(self, messages, on_delta):
+        """
+        Streams the completion token by token through on_delta and returns the full text.
+        """
+        parts = []
+        async for chunk in self.groq_chat.astream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                await on_delta(chunk.content)
+        return "".join(parts)
+
+    async def _generate_response(self, user_input: str, retrieved_data: str, on_delta=None, recipe_title: str = None):
+        """
+        Generates the bot reply. When on_delta is given, the reply is streamed to it as
+        tokens arrive; the returned message is always the full text. The full recipe is
+        sent for this turn only: memory keeps its title.
+        """
         prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=self.system_prompt),
+            SystemMessage(content=build_system_prompt(self.user_context)),
             MessagesPlaceholder(variable_name="chat_history"),
             HumanMessagePromptTemplate.from_template("{human_input}"),
         ])
 
-        chat_history = self.memory.load_memory_variables({})["chat_history"]
-        print(f"📚 Chat History Size: {len(chat_history)}")
-
-        full_prompt = prompt.format_messages(
-            chat_history=chat_history,
-            human_input=user_input
-        )
-
-        print("🧠 Prompt Sent to LLM:")
-        print(full_prompt)
+        chat_history = self.memory.messages()
 
         conversation_input = f"Retrieved Data: {retrieved_data}\nUser Question: {user_input}"
+        messages = prompt.format_messages(chat_history=chat_history, human_input=conversation_input)
 
-        conversation = LLMChain(
-            llm=self.groq_chat,
-            prompt=prompt,
-            verbose=False,
-            memory=self.memory,
+        report = prompt_token_report(
+            user_context=self.user_context,
+            history="\n".join(m.content for m in chat_history),
+            human_input=conversation_input,
         )
+        logger.info("Prompt tokens", extra={
+            "prompt_tokens": report["total"],
+            "sections": report["sections"],
+            "history_messages": len(chat_history),
+        })
 
-        response = conversation.predict(human_input=conversation_input)
+        try:
+            with stage("generation"):
+                if on_delta is not None:
+                    response = await asyncio.wait_for(self._stream_response(messages, on_delta), LLM_TIMEOUT)
+                else:
+                    response = (await asyncio.wait_for(self.groq_chat.ainvoke(messages), LLM_TIMEOUT)).content
+        except asyncio.TimeoutError:
+            logger.warning("LLM call timed out after %ss.", LLM_TIMEOUT)
+            return {
+                "type": "error",
+                "message": "الرد أخد وقت أطول من اللازم، حاول تاني بعد شوية."
+            }
+        except APIError as e:
+            # The client's own timeout (APITimeoutError), connection errors and error
+            # statuses such as 429 end the turn the same way instead of the socket.
+            logger.warning("LLM call failed: %r", e)
+            return {
+                "type": "error",
+                "message": "حصلت مشكلة في الرد، حاول تاني بعد شوية."
+            }
 
-        print("💬 Chatbot Response:\n", response)
+        logger.debug("Chatbot response: %s", response)
+        self.memory.save_turn(
+            BudgetedConversationMemory.format_input(user_input, retrieved_data, recipe_title), response
+        )
         return {
             "type": "response",
             "message": response
@@ -0,0 +1,116 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "recipe_bot_stage_seconds", "Time spent in each stage of a request.",
+    ["stage", "mode", "outcome"], buckets=LATENCY_BUCKETS,
+)
+TURN_SECONDS = Histogram(
+    "recipe_bot_turn_seconds", "Time from receiving a chat message to sending the result.",
+    ["mode", "outcome"], buckets=LATENCY_BUCKETS,
+)
+TURNS_TOTAL = Counter("recipe_bot_turns_total", "Chat messages handled.", ["mode", "outcome"])
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+# Attributes every LogRecord has; anything else was passed through extra=.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+class Turn:
+    """
+    Stage timings of one chat message. They are observed when the turn finishes,
+    so that each stage is labelled with the outcome of the whole turn.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode or "text"
+        self.started = time.perf_counter()
+        self.stages = []
+        self._token = _current_turn.set(self)
+
+    def finish(self, outcome: str):
+        _current_turn.reset(self._token)
+        elapsed = time.perf_counter() - self.started
+        TURN_SECONDS.labels(self.mode, outcome).observe(elapsed)
+        TURNS_TOTAL.labels(self.mode, outcome).inc()
+        for name, seconds in self.stages:
+            STAGE_SECONDS.labels(name, self.mode, outcome).observe(seconds)
+        return elapsed
+
+
+def start_turn(mode: str) -> Turn:
+    return Turn(mode)
+
+
+@contextmanager
+def stage(name: str, mode: str = None):
+    """
+    Times a block. Inside a turn (including threads and tasks started from it) the
+    timing joins the turn; otherwise it is observed at once with an ok/error outcome.
+    """
+    turn = _current_turn.get()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if turn is not None:
+            turn.stages.append((name, elapsed))
+        else:
+            STAGE_SECONDS.labels(name, mode or "none", outcome).observe(elapsed)
+
+
+def detached_context() -> contextvars.Context:
+    """
+    A copy of the current context outside of any turn, for background tasks that
+    may outlive the turn that starts them. Their stages are observed on their own.
+    """
+    context = contextvars.copy_context()
+    context.run(_current_turn.set, None)
+    return context
+
+
+def metrics_payload():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,78 @@
+import asyncio
+import copy
+import os
+
+from cache import TTLLRUCache
+from db import db
+
+PROFILE_CACHE_MAXSIZE = int(os.getenv("PROFILE_CACHE_MAXSIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+
+# Every field served from the cache; none of them are secrets.
+CACHED_FIELDS = {"_id": 0, "email": 1, "name": 1, "gender": 1, "profession": 1,
+                 "likes": 1, "dislikes": 1, "allergies": 1, "favorite_recipes": 1}
+
+
+class ProfileCache:
+    """
+    In-process cache of user documents keyed by email. Concurrent misses for the
+    same email share one query, and a load that races with invalidate() is not
+    stored. The TTL bounds staleness from writes made by other workers.
+    """
+
+    def __init__(self, maxsize: int = PROFILE_CACHE_MAXSIZE, ttl: float = PROFILE_CACHE_TTL):
+        self._cache = TTLLRUCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def covers(projection: dict) -> bool:
+        """
+        Whether a find_one projection can be answered from a cached document.
+        """
+        return bool(projection) and all(
+            CACHED_FIELDS.get(field) == include for field, include in projection.items()
+        )
+
+    async def _load(self, email: str):
+        try:
+            user = await db.users.find_one({"email": email}, CACHED_FIELDS)
+        finally:
+            current = self._inflight.get(email) is asyncio.current_task()
+            if current:
+                del self._inflight[email]
+        if current and user is not None:
+            self._cache.set(email, user)
+        return user
+
+    async def get(self, email: str, projection: dict = None):
+        """
+        Returns a copy of the user document restricted to projection, or None.
+        """
+        user = self._cache.get(email)
+        if user is None:
+            task = self._inflight.get(email)
+            if task is None:
+                task = asyncio.create_task(self._load(email))
+                self._inflight[email] = task
+            else:
+                self.coalesced += 1
+            # shield: a cancelled caller must not cancel the load other callers share.
+            user = await asyncio.shield(task)
+            if user is None:
+                return None
+        if projection:
+            user = {field: value for field, value in user.items() if projection.get(field)}
+        return copy.deepcopy(user)
+
+    def invalidate(self, email: str):
+        self._cache.pop(email)
+        # A load already in flight may have read the old document; detach it so its
+        # result is not cached and later callers query again.
+        self._inflight.pop(email, None)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "inflight": len(self._inflight), "coalesced": self.coalesced}
+
+
+profile_cache = ProfileCache()
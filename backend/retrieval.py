@@ -0,0 +1,334 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from arabic_text import normalize_arabic
+from cache import TTLLRUCache
+from embedding_batcher import EmbeddingBatcher, EMBED_BATCHING_ENABLED
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from observability import stage
+from vector_index import MmapBackend
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma | mmap
+VECTOR_INDEX_PATH = os.getenv(
+    "VECTOR_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAGindex", "recipes.idx"),
+)
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "recipestest")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "akhooli/Arabic-SBERT-100K")
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "4"))
+QUERY_CACHE_MAXSIZE = int(os.getenv("QUERY_CACHE_MAXSIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # hybrid | vector
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+DEFAULT_TOP_K = 5
+_NOT_BUILT = object()
+
+
+def manifest_path(backend: str) -> str:
+    """
+    Location of the ingestion manifest for a backend, next to the vector index.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(VECTOR_INDEX_PATH)), f"manifest-{backend}.json")
+
+
+class ChromaBackend:
+    """
+    Vector backend talking to the Chroma HTTP server.
+    """
+
+    name = "chroma"
+    STAT_INTERVAL = 1.0
+
+    def __init__(self, host: str = CHROMA_HOST, port: int = CHROMA_PORT, collection_name: str = COLLECTION_NAME):
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        self.manifest_path = manifest_path(self.name)
+        self.generation = None
+        self._client = None
+        self._collection = None
+        self._manifest_mtime = None
+        self._last_stat = 0.0
+
+    @property
+    def is_ready(self) -> bool:
+        return self._collection is not None
+
+    def _read_generation(self):
+        # The collection lives in another process, so re-ingestion is detected
+        # through the generation the ingestion command writes to its manifest.
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._manifest_mtime:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                generation = json.load(f).get("generation")
+            if generation != self.generation:
+                # Re-ingestion deletes and recreates the collection, so the old
+                # handle points at a collection id that no longer exists.
+                self._collection = None
+            self.generation = generation
+            self._manifest_mtime = mtime
+
+    def load(self):
+        import chromadb
+
+        if self._client is None:
+            self._client = chromadb.HttpClient(host=self.host, port=self.port)
+        if self._collection is None:
+            try:
+                # Queries are sent as embeddings, so no embedding function is attached here.
+                self._collection = self._client.get_collection(self.collection_name)
+                logger.info("Collection %r found.", self.collection_name)
+            except chromadb.errors.InvalidCollectionException:
+                # Try the lookup again on the next query.
+                logger.warning("Collection %r does not exist. Please add data first.", self.collection_name)
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._last_stat >= self.STAT_INTERVAL:
+            self._last_stat = now
+            self._read_generation()
+        if self._collection is None:
+            self.load()
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "collection": self.collection_name,
+            "found": self._collection is not None,
+            "generation": self.generation,
+        }
+
+    def all_records(self) -> list:
+        if self._collection is None:
+            return []
+        results = self._collection.get(include=["documents", "metadatas"])
+        return [
+            {"title": (metadata or {}).get("title", "وصفة بدون عنوان"), "document": doc}
+            for doc, metadata in zip(results["documents"], results["metadatas"])
+        ]
+
+    def query(self, embedding, n_results: int) -> list:
+        if self._collection is None:
+            return []
+
+        results = self._collection.query(
+            query_embeddings=[np.asarray(embedding, dtype=np.float32).tolist()],
+            n_results=n_results,
+            include=["documents", "metadatas"],
+        )
+
+        structured_results = []
+        for doc, metadata in zip(results["documents"][0], results["metadatas"][0]):
+            structured_results.append({
+                "title": (metadata or {}).get("title", "وصفة بدون عنوان"),
+                "document": doc,
+            })
+        return structured_results
+
+
+def create_backend(name: str = VECTOR_BACKEND):
+    if name == "chroma":
+        return ChromaBackend()
+    if name == "mmap":
+        return MmapBackend(VECTOR_INDEX_PATH)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {name}")
+
+
+class RetrievalEngine:
+    """
+    Process-wide retrieval engine. The embedding model and the vector backend are
+    loaded once and shared by every WebSocketBotSession.
+    """
+
+    def __init__(self, backend=None, model_name: str = EMBEDDING_MODEL,
+                 max_concurrency: int = RETRIEVAL_MAX_CONCURRENCY,
+                 cache_maxsize: int = QUERY_CACHE_MAXSIZE, cache_ttl: float = QUERY_CACHE_TTL,
+                 mode: str = RETRIEVAL_MODE):
+        self.backend = backend if backend is not None else create_backend()
+        self.model_name = model_name
+        self.mode = mode
+        self.lexical = LexicalIndex()
+        # Query encodes from concurrent sessions are micro-batched into one forward pass.
+        self.batcher = EmbeddingBatcher(self.embed) if EMBED_BATCHING_ENABLED else None
+        self.max_concurrency = max_concurrency
+        self.model = None
+        self.last_error = None
+        # Both caches are keyed on the Arabic-normalized query and are dropped
+        # whenever the backend reports a new index generation.
+        self.embedding_cache = TTLLRUCache(cache_maxsize, cache_ttl)
+        self.result_cache = TTLLRUCache(cache_maxsize, cache_ttl)
+        self._cache_generation = None
+        self._lexical_generation = _NOT_BUILT
+        self._generation_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._semaphore = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.model is not None and self.backend.is_ready
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "model": self.model_name,
+            "model_loaded": self.model is not None,
+            "mode": self.mode,
+            "lexical_documents": len(self.lexical),
+            "vector_store": self.backend.describe(),
+            "last_error": self.last_error,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "embedding_batcher": self.batcher.stats() if self.batcher is not None else None,
+        }
+
+    def invalidate_caches(self):
+        self.embedding_cache.clear()
+        self.result_cache.clear()
+
+    def load(self):
+        """
+        Loads the embedding model and the vector backend. Safe to call from several
+        threads; only the first caller does the work.
+        """
+        if self.is_ready:
+            return
+
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+
+                logger.info("Loading embedding model %r...", self.model_name)
+                self.model = SentenceTransformer(self.model_name)
+            if not self.backend.is_ready:
+                self.backend.load()
+            self.last_error = None
+
+    async def warm_up(self):
+        """
+        Loads the engine off the event loop. Errors are recorded instead of raised
+        so that the app still starts when the vector store is not reachable yet.
+        """
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Retrieval engine warm-up failed: %s", e)
+
+    def embed(self, texts: list) -> np.ndarray:
+        self.load()
+        return np.asarray(self.model.encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+
+    def _check_generation(self):
+        self.backend.refresh()
+        generation = self.backend.generation
+        lexical_stale = self.mode == "hybrid" and self._lexical_generation != generation and self.backend.is_ready
+        if generation == self._cache_generation and not lexical_stale:
+            return
+
+        with self._generation_lock:
+            if generation != self._cache_generation:
+                if self._cache_generation is not None:
+                    logger.info("Vector index changed, clearing query caches.")
+                self.invalidate_caches()
+                self._cache_generation = generation
+            if lexical_stale and self._lexical_generation != generation:
+                # The BM25 index is built from the same records the vector backend
+                # serves, and swapped in as a whole.
+                lexical = LexicalIndex()
+                lexical.build(self.backend.all_records())
+                self.lexical = lexical
+                self._lexical_generation = generation
+
+    def embed_query(self, query: str) -> np.ndarray:
+        key = normalize_arabic(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            with stage("embedding"):
+                embedding = self.embed([query])[0]
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        key = normalize_arabic(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            if self.model is None:
+                await asyncio.to_thread(self.load)
+            with stage("embedding"):
+                embedding = await self.batcher.embed(query)
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    def search(self, query: str, n_results: int = DEFAULT_TOP_K, embedding=None) -> list:
+        """
+        Retrieves top matching recipes and returns both titles and documents.
+        """
+        self.load()
+        self._check_generation()
+
+        key = (normalize_arabic(query), n_results)
+        results = self.result_cache.get(key)
+        if results is None:
+            if embedding is None:
+                embedding = self.embed_query(query)
+            with stage("vector_search"):
+                if self.mode == "hybrid":
+                    results = self._hybrid_search(query, embedding, n_results)
+                else:
+                    results = self.backend.query(embedding, n_results)
+            if results:
+                self.result_cache.set(key, results)
+        return [dict(result) for result in results]
+
+    def _hybrid_search(self, query: str, embedding, n_results: int) -> list:
+        """
+        Fuses vector and BM25 candidates with reciprocal rank fusion.
+        """
+        candidates = max(n_results, HYBRID_CANDIDATES)
+        vector_results = self.backend.query(embedding, candidates)
+        lexical_results = [record for record, _ in self.lexical.search(query, candidates)]
+        fused = reciprocal_rank_fusion([vector_results, lexical_results], k=RRF_K)
+        return [{"title": result["title"], "document": result["document"]} for result in fused[:n_results]]
+
+    async def asearch(self, query: str, n_results: int = DEFAULT_TOP_K) -> list:
+        """
+        Runs search() in a worker thread, bounded so that a burst of sessions can't
+        pile up unbounded vector searches. With batching on, the query is encoded
+        through the shared EmbeddingBatcher first.
+        """
+        embedding = await self.aembed_query(query) if self.batcher is not None else None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            search = asyncio.ensure_future(asyncio.to_thread(self.search, query, n_results, embedding))
+            try:
+                return await asyncio.shield(search)
+            except asyncio.CancelledError:
+                # A worker thread can't be stopped: keep the slot until it is done,
+                # otherwise cancelled (speculative) searches escape the bound.
+                await asyncio.wait([search])
+                raise
+
+    async def close(self):
+        if self.batcher is not None:
+            await self.batcher.close()
+
+
+retrieval_engine = RetrievalEngine()
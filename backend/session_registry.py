@@ -0,0 +1,141 @@
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "900"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class SessionEntry:
+    __slots__ = ("email", "session_id", "session", "chat_id", "websocket", "last_seen", "footprint")
+
+    def __init__(self, email: str, session_id: str, session, chat_id):
+        self.email = email
+        self.session_id = session_id
+        self.session = session
+        self.chat_id = chat_id
+        self.websocket = None
+        self.last_seen = time.monotonic()
+        self.footprint = session.footprint()
+
+
+class SessionRegistry:
+    """
+    Chat sessions keyed by (email, session id), so that a client reconnecting with
+    its session id gets its conversation, pending suggestions and retrieved recipes
+    back. Sessions without a connection expire after SESSION_IDLE_TTL seconds, and
+    the least recently used ones are evicted beyond SESSION_MAX_COUNT sessions or
+    SESSION_MAX_BYTES of estimated footprint.
+    """
+
+    def __init__(self, max_count: int = SESSION_MAX_COUNT, idle_ttl: float = SESSION_IDLE_TTL,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.max_count = max_count
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def create(self, email: str, session, chat_id) -> SessionEntry:
+        entry = SessionEntry(email, secrets.token_urlsafe(16), session, chat_id)
+        self._entries[(email, entry.session_id)] = entry
+        self.total_bytes += entry.footprint
+        self.created += 1
+        self.sweep()
+        return entry
+
+    def resume(self, email: str, session_id: str):
+        """
+        Returns the live entry for (email, session_id), or None if it is unknown,
+        expired or evicted.
+        """
+        self.sweep()
+        entry = self._entries.get((email, session_id))
+        if entry is not None:
+            self._entries.move_to_end((email, session_id))
+            entry.last_seen = time.monotonic()
+            self.resumed += 1
+        return entry
+
+    def replace_session(self, entry: SessionEntry, session, chat_id):
+        entry.session = session
+        entry.chat_id = chat_id
+        self.touch(entry)
+
+    def touch(self, entry: SessionEntry):
+        """
+        Marks the entry recently used and refreshes its footprint after a turn.
+        """
+        key = (entry.email, entry.session_id)
+        entry.last_seen = time.monotonic()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            footprint = entry.session.footprint()
+            self.total_bytes += footprint - entry.footprint
+            entry.footprint = footprint
+            if self.total_bytes > self.max_bytes:
+                self.sweep()
+
+    def release(self, entry: SessionEntry, websocket):
+        """
+        Called when a connection ends; the idle TTL starts now. A newer connection
+        that took the session over keeps it.
+        """
+        if entry.websocket is websocket:
+            entry.websocket = None
+            entry.last_seen = time.monotonic()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.footprint
+
+    def sweep(self):
+        now = time.monotonic()
+        if self.idle_ttl > 0:
+            for key in [key for key, entry in self._entries.items()
+                        if entry.websocket is None and now - entry.last_seen > self.idle_ttl]:
+                self._remove(key)
+                self.expired += 1
+        # Least recently used first. A connected session that is evicted keeps working
+        # for its current connection; it just cannot be resumed.
+        while self._entries and (len(self._entries) > self.max_count or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self, per_session: bool = False) -> dict:
+        self.sweep()
+        footprints = [entry.footprint for entry in self._entries.values()]
+        stats = {
+            "sessions": len(self._entries),
+            "connected": sum(1 for entry in self._entries.values() if entry.websocket is not None),
+            "max_sessions": self.max_count,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "avg_session_bytes": self.total_bytes // len(footprints) if footprints else 0,
+            "max_session_bytes": max(footprints, default=0),
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+        if per_session:
+            now = time.monotonic()
+            stats["per_session"] = [
+                {
+                    "email": entry.email,
+                    "bytes": entry.footprint,
+                    "connected": entry.websocket is not None,
+                    "idle_seconds": round(now - entry.last_seen, 1),
+                }
+                for entry in self._entries.values()
+            ]
+        return stats
+
+
+session_registry = SessionRegistry()
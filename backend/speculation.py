@@ -0,0 +1,108 @@
+import asyncio
+import difflib
+import logging
+import os
+import threading
+
+from intent_fastpath import request_key, title_key
+from observability import detached_context
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_RETRIEVAL_ENABLED = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+SPECULATION_MATCH_CUTOFF = float(os.getenv("SPECULATION_MATCH_CUTOFF", "0.85"))
+
+
+def _consume_exception(task: asyncio.Task):
+    if not task.cancelled():
+        task.exception()
+
+
+class SpeculativeRetrieval:
+    """
+    Starts vector searches on the raw message and on its normalized dish part while
+    the intent classifier is still running, and reuses one of them when the
+    classifier's dish name matches the speculated query closely.
+    """
+
+    def __init__(self, engine, match_cutoff: float = SPECULATION_MATCH_CUTOFF):
+        self.engine = engine
+        self.match_cutoff = match_cutoff
+        self._lock = threading.Lock()
+        self.counters = {"launched": 0, "searches": 0, "hits": 0, "misses": 0, "discarded": 0, "wasted_searches": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def start(self, message: str) -> dict:
+        """
+        Returns {matching key: search task} for the speculative queries.
+        """
+        queries = {title_key(message): message}
+        normalized = request_key(message)
+        if normalized:
+            queries.setdefault(normalized, normalized)
+
+        tasks = {}
+        for key, query in queries.items():
+            if key:
+                # Detached from the turn: a discarded search can still be running
+                # after the turn finished and must not add its stages to it.
+                task = detached_context().run(asyncio.create_task, self.engine.asearch(query))
+                task.add_done_callback(_consume_exception)
+                tasks[key] = task
+        self._count("launched")
+        self._count("searches", len(tasks))
+        return tasks
+
+    def discard(self, tasks: dict):
+        """
+        The classifier decided no retrieval is needed.
+        """
+        for task in tasks.values():
+            task.cancel()
+        self._count("discarded")
+        self._count("wasted_searches", len(tasks))
+
+    async def resolve(self, tasks: dict, dish: str):
+        """
+        Returns the speculative result for dish, or None when no speculated query is
+        close enough and a regular search is needed.
+        """
+        dish_key = title_key(dish)
+        best_key, best_ratio = None, 0.0
+        for key in tasks:
+            ratio = difflib.SequenceMatcher(None, dish_key, key).ratio()
+            if ratio > best_ratio:
+                best_key, best_ratio = key, ratio
+
+        if best_key is not None and best_ratio >= self.match_cutoff:
+            for key, task in tasks.items():
+                if key != best_key:
+                    task.cancel()
+            try:
+                documents = await tasks[best_key]
+            except Exception as e:
+                logger.warning("Speculative retrieval failed: %r", e)
+                documents = None
+            if documents is not None:
+                self._count("hits")
+                self._count("wasted_searches", len(tasks) - 1)
+                return documents
+
+        for task in tasks.values():
+            task.cancel()
+        self._count("misses")
+        self._count("wasted_searches", len(tasks))
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        resolved = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / resolved, 4) if resolved else 0.0
+        counters["wasted_rate"] = (
+            round(counters["wasted_searches"] / counters["searches"], 4) if counters["searches"] else 0.0
+        )
+        return counters
@@ -0,0 +1,146 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import wave
+
+import numpy as np
+
+from llm_clients import get_async_groq
+
+logger = logging.getLogger(__name__)
+
+STT_MODEL = os.getenv("STT_MODEL", "whisper-large-v3-turbo")
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "ar")
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", "60"))
+STT_MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "4"))
+STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+STT_SPOOL_MAX_MEMORY = int(os.getenv("STT_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+STT_PREPROCESS = os.getenv("STT_PREPROCESS", "1") == "1"
+STT_TARGET_RATE = 16000
+SILENCE_FRAME_MS = 20
+SILENCE_THRESHOLD_DB = float(os.getenv("STT_SILENCE_THRESHOLD_DB", "-45"))
+SILENCE_PADDING_MS = 200
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_semaphore = None
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def spool_upload(upload) -> tempfile.SpooledTemporaryFile:
+    """
+    Copies an UploadFile in chunks into a spooled temp file that moves to disk past
+    STT_SPOOL_MAX_MEMORY, so large recordings never sit fully in RAM.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=STT_SPOOL_MAX_MEMORY)
+    size = 0
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > STT_MAX_UPLOAD_BYTES:
+            spool.close()
+            raise UploadTooLarge(f"Audio upload exceeds {STT_MAX_UPLOAD_BYTES} bytes.")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def is_wav(fileobj) -> bool:
+    header = fileobj.read(12)
+    fileobj.seek(0)
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def _read_pcm(fileobj):
+    with wave.open(fileobj, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+    return samples.reshape(-1, channels), rate
+
+
+def _trim_silence(samples: np.ndarray, rate: int) -> np.ndarray:
+    frame = max(1, rate * SILENCE_FRAME_MS // 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    loud = np.nonzero(20 * np.log10(rms + 1e-10) > SILENCE_THRESHOLD_DB)[0]
+    if len(loud) == 0:
+        return samples
+    padding = rate * SILENCE_PADDING_MS // 1000
+    start = max(0, loud[0] * frame - padding)
+    end = min(len(samples), (loud[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def compact_wav(fileobj) -> io.BytesIO:
+    """
+    Downmixes WAV audio to mono, resamples it to 16 kHz and trims leading and
+    trailing silence. Returns a 16-bit PCM WAV.
+    """
+    samples, rate = _read_pcm(fileobj)
+    mono = samples.mean(axis=1)
+    if rate != STT_TARGET_RATE and len(mono):
+        duration = len(mono) / rate
+        target_times = np.arange(int(duration * STT_TARGET_RATE)) / STT_TARGET_RATE
+        mono = np.interp(target_times, np.arange(len(mono)) / rate, mono)
+    mono = _trim_silence(mono, STT_TARGET_RATE)
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(STT_TARGET_RATE)
+        wav.writeframes((np.clip(mono, -1, 1) * 32767).astype("<i2").tobytes())
+    out.seek(0)
+    return out
+
+
+def prepare_audio(spool, filename: str):
+    """
+    Returns (filename, file object) to upload, compacted when the input is WAV.
+    """
+    if STT_PREPROCESS and is_wav(spool):
+        try:
+            return "audio.wav", compact_wav(spool)
+        except (wave.Error, ValueError, EOFError) as e:
+            logger.warning("WAV preprocessing skipped: %s", e)
+            spool.seek(0)
+    return filename, spool
+
+
+async def transcribe_upload(upload) -> str:
+    """
+    Transcribes an UploadFile without blocking the event loop, with at most
+    STT_MAX_CONCURRENCY transcriptions in flight per worker.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(STT_MAX_CONCURRENCY)
+
+    spool = await spool_upload(upload)
+    try:
+        async with _semaphore:
+            filename, audio = await asyncio.to_thread(prepare_audio, spool, upload.filename or "audio.wav")
+            transcription = await get_async_groq().audio.transcriptions.create(
+                file=(filename, audio),
+                model=STT_MODEL,
+                language=STT_LANGUAGE,
+                response_format="verbose_json",
+                timeout=STT_TIMEOUT,
+            )
+        return transcription.text
+    finally:
+        spool.close()
@@ -0,0 +1,47 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Groq does not publish the chat model's tokenizer; this one has a comparable
+# vocabulary for Arabic and is only used for reporting and budgeting.
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "Xenova/gpt-4o")
+BYTES_PER_TOKEN = 4
+
+_tokenizer = None
+_load_lock = threading.Lock()
+_load_failed = False
+
+
+def load_tokenizer():
+    """
+    Loads the tokenizer (possibly downloading it). Called from a worker thread at
+    startup; until it finishes, counts fall back to estimate_tokens().
+    """
+    global _tokenizer, _load_failed
+    with _load_lock:
+        if _tokenizer is None and not _load_failed:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            except Exception as e:
+                _load_failed = True
+                logger.warning("Tokenizer %s unavailable, token counts are estimates: %s", TOKENIZER_NAME, e)
+    return _tokenizer
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text.encode("utf-8")) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _tokenizer is None:
+        return estimate_tokens(text)
+    return len(_tokenizer.encode(text, add_special_tokens=False))
+
+
+def tokenizer_info() -> dict:
+    return {"tokenizer": TOKENIZER_NAME, "exact": _tokenizer is not None}
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import re
+
+from dotenv import load_dotenv
+from elevenlabs.client import AsyncElevenLabs
+
+load_dotenv()
+
+TTS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+TTS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
+TTS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT", "mp3_44100_128")
+TTS_PIPELINE_DEPTH = int(os.getenv("TTS_PIPELINE_DEPTH", "2"))
+TTS_MIN_SENTENCE_CHARS = int(os.getenv("TTS_MIN_SENTENCE_CHARS", "40"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?؟؛…\n])\s+")
+
+_client = None
+
+
+def get_tts_client() -> AsyncElevenLabs:
+    """
+    The ElevenLabs client shared by every /speak-text request.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+    return _client
+
+
+def synthesize(text: str, voice_id: str = TTS_VOICE_ID, model_id: str = TTS_MODEL_ID,
+               output_format: str = TTS_OUTPUT_FORMAT):
+    """
+    Async iterator over the audio chunks of text, as the provider yields them.
+    """
+    return get_tts_client().text_to_speech.convert(
+        voice_id=voice_id,
+        output_format=output_format,
+        text=text,
+        model_id=model_id,
+    )
+
+
+def split_sentences(text: str, min_chars: int = TTS_MIN_SENTENCE_CHARS) -> list:
+    """
+    Splits text on sentence punctuation and newlines, merging fragments shorter
+    than min_chars into the next one so each request carries enough prosody context.
+    """
+    sentences, current = [], ""
+    for part in _SENTENCE_END.split(text.strip()):
+        current = f"{current} {part}".strip() if current else part.strip()
+        if len(current) >= min_chars:
+            sentences.append(current)
+            current = ""
+    if current:
+        if sentences and len(current) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {current}"
+        else:
+            sentences.append(current)
+    return sentences
+
+
+async def synthesize_pipelined(text: str, depth: int = TTS_PIPELINE_DEPTH, **voice):
+    """
+    Synthesizes text sentence by sentence with up to depth sentences in flight,
+    yielding audio strictly in order. The first sentence plays while the next ones
+    are still being generated.
+    """
+    semaphore = asyncio.Semaphore(max(1, depth))
+
+    async def produce(sentence: str, queue: asyncio.Queue):
+        async with semaphore:
+            try:
+                async for chunk in synthesize(sentence, **voice):
+                    await queue.put(chunk)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await queue.put(None)
+
+    sentences = split_sentences(text)
+    queues = [asyncio.Queue() for _ in sentences]
+    tasks = [asyncio.create_task(produce(sentence, queue)) for sentence, queue in zip(sentences, queues)]
+    try:
+        for queue in queues:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def start_stream(chunks):
+    """
+    Waits for the first audio chunk so that provider errors surface before the
+    HTTP response has started, then returns an iterator over the whole stream.
+    """
+    iterator = chunks.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def body():
+        if first:
+            yield first
+        async for chunk in iterator:
+            yield chunk
+
+    return body()
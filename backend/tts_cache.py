@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE", "1") == "1"
+TTS_CACHE_DIR = os.getenv(
+    "TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tts_cache")
+)
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache of synthesized audio with a total size budget
+    and LRU eviction. Recency survives restarts through the files' mtime.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = None  # key -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, voice_id: str, model_id: str, output_format: str) -> str:
+        # Only whitespace is normalized: diacritics change the pronunciation.
+        normalized = _WHITESPACE.sub(" ", text).strip()
+        payload = json.dumps([normalized, voice_id, model_id, output_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    if filename.endswith(".mp3"):
+                        st = os.stat(os.path.join(root, filename))
+                        found.append((st.st_mtime, filename[:-4], st.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self.total_bytes = sum(self._entries.values())
+
+    def contains(self, key: str) -> bool:
+        self._load()
+        return key in self._entries
+
+    def lookup(self, key: str):
+        """
+        Returns the cached file path and marks it recently used, or None.
+        """
+        self._load()
+        if key in self._entries:
+            path = self.path_for(key)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self.total_bytes -= self._entries.pop(key)
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return path
+        self.misses += 1
+        return None
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    async def tee(self, key: str, chunks):
+        """
+        Passes audio chunks through while writing them to the cache. The file is only
+        committed when the stream completes, so aborted syntheses are never cached.
+        """
+        self._load()
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.part"
+        size = 0
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = size > 0
+        finally:
+            if completed:
+                os.replace(tmp_path, path)
+                if key in self._entries:
+                    self.total_bytes -= self._entries.pop(key)
+                self._entries[key] = size
+                self.total_bytes += size
+                self.stores += 1
+                self._evict()
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> dict:
+        self._load()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+tts_cache = TTSCache()
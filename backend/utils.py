@@ -1,18 +1,50 @@
 from passlib.context import CryptContext
 from bson.objectid import ObjectId
 from db import db
+from profile_cache import profile_cache
 from pymongo.collection import Collection
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import asyncio
+import calendar
+import hashlib
+import os
+
+CHAT_LOG_PAGE_SIZE = 20
+MAX_CHAT_LOG_PAGE_SIZE = 100
+
+# Projections for the fields each caller actually reads from a user document.
+PROFILE_FIELDS = {"_id": 0, "name": 1, "likes": 1, "dislikes": 1, "allergies": 1}
+SESSION_FIELDS = {"_id": 0, "email": 1, "name": 1, "gender": 1, "profession": 1,
+                  "likes": 1, "dislikes": 1, "allergies": 1, "favorite_recipes": 1}
+LOGIN_FIELDS = {"_id": 0, "email": 1, "password": 1}
+EXISTS_FIELDS = {"_id": 1}
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt is CPU bound, so it runs in worker threads with a bounded number in flight.
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 2)))
+_hash_semaphore = None
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def _run_hashing(func, *args):
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+    async with _hash_semaphore:
+        return await asyncio.to_thread(func, *args)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
 async def update_user_field(email: str, field: str, updated_list: list):
     if field not in ["likes", "dislikes", "allergies"]:
         raise ValueError("Invalid field")
@@ -21,47 +53,142 @@ async def update_user_field(email: str, field: str, updated_list: list):
         {"email": email},
         {"$set": {field: updated_list}}
     )
+    profile_cache.invalidate(email)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_chat_cursor(timestamp: datetime, chat_id) -> str:
+    # Motor returns naive datetimes in UTC, so they must not be read as local time.
+    millis = calendar.timegm(timestamp.utctimetuple()) * 1000 + timestamp.microsecond // 1000
+    return f"{millis}_{chat_id}"
+
+def decode_chat_cursor(cursor: str):
+    millis, chat_id = cursor.split("_", 1)
+    if not ObjectId.is_valid(chat_id):
+        raise ValueError("Invalid cursor")
+    try:
+        timestamp = _EPOCH + timedelta(milliseconds=int(millis))
+    except OverflowError:
+        raise ValueError("Invalid cursor")
+    return timestamp, ObjectId(chat_id)
 
+async def get_user_chats(email: str, cursor: str = None, limit: int = CHAT_LOG_PAGE_SIZE):
+    """
+    Lightweight chat-log summaries, newest first, with a cursor for the next page.
+    Transcripts are not transferred; use get_chat_log for those.
+    """
+    limit = max(1, min(limit, MAX_CHAT_LOG_PAGE_SIZE))
+    match = {"email": email}
+    if cursor:
+        timestamp, chat_id = decode_chat_cursor(cursor)
+        match["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": chat_id}},
+        ]
 
-async def save_chat_log(email: str, chat: list):
-    await db.chat_logs.insert_one({
-        "email": email,
-        "chat": chat,
-        "timestamp": datetime.utcnow()
-    })
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"timestamp": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {
+            "timestamp": 1,
+            "first_message": {"$arrayElemAt": ["$chat.text", 0]},
+            "turns": {"$size": {"$ifNull": ["$chat", []]}},
+        }},
+    ]
+    chats = await db.chat_logs.aggregate(pipeline).to_list(length=limit + 1)
 
-async def get_user_chats(email: str):
-    chats = await db.chat_logs.find({"email": email}).sort("timestamp", -1).to_list(length=20)
-    return [{"_id": str(chat["_id"]), "chat": chat["chat"], "timestamp": chat["timestamp"]} for chat in chats]
+    next_cursor = None
+    if len(chats) > limit:
+        chats = chats[:limit]
+        next_cursor = encode_chat_cursor(chats[-1]["timestamp"], chats[-1]["_id"])
 
-async def get_user_by_email(email: str):
-    return await db.users.find_one({"email": email})
+    return {
+        "chats": [{
+            "_id": str(chat["_id"]),
+            "timestamp": chat["timestamp"],
+            "first_message": chat.get("first_message"),
+            "turns": chat.get("turns", 0),
+        } for chat in chats],
+        "next_cursor": next_cursor,
+    }
+
+async def get_chat_log(email: str, chat_id: str):
+    """
+    Full transcript of one chat log, only if it belongs to email.
+    """
+    if not ObjectId.is_valid(chat_id):
+        return None
+    chat = await db.chat_logs.find_one({"_id": ObjectId(chat_id), "email": email}, {"chat": 1, "timestamp": 1})
+    if not chat:
+        return None
+    return {"_id": str(chat["_id"]), "chat": chat["chat"], "timestamp": chat["timestamp"]}
+
+async def get_user_by_email(email: str, projection: dict = None):
+    """
+    Projections covered by the profile cache are served from it; anything else,
+    such as the password hash, always comes from MongoDB.
+    """
+    if profile_cache.covers(projection):
+        return await profile_cache.get(email, projection)
+    return await db.users.find_one({"email": email}, projection)
 
 async def create_user(data: dict):
-    data["password"] = hash_password(data["password"])
+    data["password"] = await hash_password_async(data["password"])
     result = await db.users.insert_one(data)
+    profile_cache.invalidate(data["email"])
     return str(result.inserted_id)
 
+def recipe_id_for(recipe_title: str, recipe_content: str) -> str:
+    """
+    Content-addressed id of the canonical recipe record.
+    """
+    return hashlib.sha256(f"{recipe_title}\n{recipe_content}".encode("utf-8")).hexdigest()[:24]
+
 async def get_user_favourites_by_email(email: str) -> Optional[List[Dict]]:
-    user = await get_user_by_email(email)
-    if user and "favorite_recipes" in user:
-        return user["favorite_recipes"]
-    return None
+    """
+    Favourites with their recipe text. User documents only hold {recipe_id, title}
+    references; the bodies are resolved from the recipes collection here.
+    """
+    user = await get_user_by_email(email, {"_id": 0, "favorite_recipes": 1})
+    if not user or "favorite_recipes" not in user:
+        return None
 
+    favourites = user["favorite_recipes"]
+    ids = [fav["recipe_id"] for fav in favourites if "recipe_id" in fav]
+    bodies = {}
+    if ids:
+        async for recipe in db.recipes.find({"_id": {"$in": ids}}, {"document": 1}):
+            bodies[recipe["_id"]] = recipe["document"]
 
-async def add_recipe_to_favourites(user_email: str, recipe_title: str, recipe_content: str):
-    user = await get_user_by_email(user_email)
-    if not user:
-        return {"status": "error", "message": "User not found."}
+    # Entries saved before references existed still carry their own "recipe" text.
+    return [
+        {"title": fav["title"], "recipe": bodies.get(fav.get("recipe_id"), fav.get("recipe", ""))}
+        for fav in favourites
+    ]
 
-    favourites = user.get("favorite_recipes", [])
-    for recipe in favourites:
-        if recipe["title"] == recipe_title:
-            return {"status": "exists", "message": "Recipe already in favourites."}
 
-    new_entry = {"title": recipe_title, "recipe": recipe_content}
-    await db.users.update_one(
-        {"email": user_email},
-        {"$push": {"favorite_recipes": new_entry}}
+async def add_recipe_to_favourites(user_email: str, recipe_title: str, recipe_content: str):
+    recipe_id = recipe_id_for(recipe_title, recipe_content)
+    # The recipe upsert is idempotent and runs concurrently with the favourite update,
+    # which is a single conditional $push, so concurrent clicks can't add duplicates.
+    _, result = await asyncio.gather(
+        db.recipes.update_one(
+            {"_id": recipe_id},
+            {"$setOnInsert": {"title": recipe_title, "document": recipe_content}},
+            upsert=True,
+        ),
+        db.users.update_one(
+            {"email": user_email, "favorite_recipes.title": {"$ne": recipe_title}},
+            {"$push": {"favorite_recipes": {"recipe_id": recipe_id, "title": recipe_title}}},
+        ),
     )
-    return {"status": "success", "message": "Recipe added to favourites."}
+    if result.modified_count:
+        profile_cache.invalidate(user_email)
+        return {"status": "success", "message": "Recipe added to favourites."}
+
+    # Nothing matched: either the user does not exist or the title is already there.
+    if not await get_user_by_email(user_email, EXISTS_FIELDS):
+        return {"status": "error", "message": "User not found."}
+    return {"status": "exists", "message": "Recipe already in favourites."}
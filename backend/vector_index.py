@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+
+import numpy as np
+
+# File layout: fixed prefix (magic, format version, header length), a UTF-8 JSON
+# header with the records, then a row-major (count, dim) matrix of L2-normalized
+# embeddings starting at a 64-byte aligned offset so it can be memory-mapped.
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RCPVEC\x00\x00"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<8sII")
+DATA_ALIGNMENT = 64
+SUPPORTED_DTYPES = {"float32": np.float32, "float16": np.float16}
+SCORE_CHUNK_ROWS = 4096
+
+
+def _aligned(offset: int) -> int:
+    return (offset + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_index(path: str, embeddings, records: list, model_name: str = None, dtype: str = "float32") -> dict:
+    """
+    Writes embeddings and their records ({"id", "title", "document", "metadata"})
+    to a single index file. The file is written next to the target and swapped in
+    with os.replace, so readers never see a half-written index.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    matrix = normalize_rows(embeddings) if len(records) else np.zeros((0, 0), dtype=np.float32)
+    if matrix.shape[0] != len(records):
+        raise ValueError("Number of embeddings does not match number of records.")
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "generation": uuid.uuid4().hex,
+        "created_at": time.time(),
+        "model": model_name,
+        "dtype": dtype,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "records": records,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_offset = _aligned(PREFIX.size + len(header_bytes))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\x00" * (data_offset - PREFIX.size - len(header_bytes)))
+        f.write(np.ascontiguousarray(matrix, dtype=SUPPORTED_DTYPES[dtype]).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return {key: value for key, value in header.items() if key != "records"}
+
+
+class MmapVectorIndex:
+    """
+    Read-only view over an index file. The embedding matrix is memory-mapped, so
+    several worker processes opening the same file share its pages.
+    """
+
+    def __init__(self, path: str, header: dict, matrix: np.ndarray):
+        self.path = path
+        self.header = header
+        self.records = header["records"]
+        self.matrix = matrix
+
+    @classmethod
+    def open(cls, path: str) -> "MmapVectorIndex":
+        with open(path, "rb") as f:
+            magic, version, header_len = PREFIX.unpack(f.read(PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a vector index file.")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported index format version {version} in {path}.")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        count, dim = header["count"], header["dim"]
+        dtype = SUPPORTED_DTYPES[header["dtype"]]
+        if count == 0:
+            matrix = np.zeros((0, dim), dtype=dtype)
+        else:
+            matrix = np.memmap(path, dtype=dtype, mode="r",
+                               offset=_aligned(PREFIX.size + header_len), shape=(count, dim))
+        return cls(path, header, matrix)
+
+    @property
+    def generation(self) -> str:
+        return self.header["generation"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def scores(self, query_embedding) -> np.ndarray:
+        query = normalize_rows(query_embedding)[0]
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+
+        # float16 rows are upcast in chunks to keep the temporary copy small.
+        out = np.empty(len(self.records), dtype=np.float32)
+        for start in range(0, len(self.records), SCORE_CHUNK_ROWS):
+            end = start + SCORE_CHUNK_ROWS
+            out[start:end] = self.matrix[start:end].astype(np.float32) @ query
+        return out
+
+    def search(self, query_embedding, k: int = 5) -> list:
+        """
+        Returns the top-k (row, cosine similarity) pairs, best first.
+        """
+        if not self.records or k <= 0:
+            return []
+        scores = self.scores(query_embedding)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class MmapBackend:
+    """
+    In-process vector backend over an MmapVectorIndex. The file is re-opened when
+    it is replaced on disk (e.g. by the ingestion command).
+    """
+
+    name = "mmap"
+    STAT_INTERVAL = 1.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = None
+        self._stat_key = None
+        self._last_stat = 0.0
+
+    @property
+    def is_ready(self) -> bool:
+        return self.index is not None
+
+    @property
+    def generation(self):
+        index = self.index
+        return index.generation if index is not None else None
+
+    def _file_key(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.warning("Vector index %r does not exist. Please run the ingestion first.", self.path)
+            return
+        key = self._file_key()
+        if self.index is None or key != self._stat_key:
+            self.index = MmapVectorIndex.open(self.path)
+            self._stat_key = key
+            logger.info("Vector index %r loaded (%d recipes).", self.path, len(self.index))
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._last_stat < self.STAT_INTERVAL:
+            return
+        self._last_stat = now
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            logger.warning("Could not reload vector index: %s", e)
+
+    # refresh() may swap in a re-ingested index from another thread at any time, so
+    # each reader takes self.index once and uses only that snapshot.
+
+    def describe(self) -> dict:
+        index = self.index
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "found": index is not None,
+            "count": len(index) if index is not None else 0,
+            "generation": index.generation if index is not None else None,
+        }
+
+    def all_records(self) -> list:
+        index = self.index
+        if index is None:
+            return []
+        return [{"title": record.get("title") or "وصفة بدون عنوان", "document": record["document"]}
+                for record in index.records]
+
+    def query(self, embedding, n_results: int) -> list:
+        index = self.index
+        if index is None:
+            return []
+        results = []
+        for row, score in index.search(embedding, n_results):
+            record = index.records[row]
+            results.append({
+                "title": record.get("title") or "وصفة بدون عنوان",
+                "document": record["document"],
+                "score": score,
+            })
+        return results
@@ -5,6 +5,12 @@ import { Heart, ThumbsDown, AlertTriangle, Trash2, Plus, Edit3, UserCircle2 } fr
 
 
 
+// Session token from /login; the backend still accepts the raw email without it.
+const authHeaders = () => {
+  const token = localStorage.getItem("sessionToken");
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
 function Chat() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState("");
@@ -35,6 +41,9 @@ function Chat() {
   const mediaRecorderRef = useRef(null);
   const recordedChunksRef = useRef([]);
   const messageListRef = useRef(null);
+  const streamedTextRef = useRef("");
+  const reconnectAttemptsRef = useRef(0);
+  const MAX_RECONNECT_ATTEMPTS = 3;
 
   useEffect(() => {
     if (mode) connectWebSocket();
@@ -54,7 +63,10 @@ function Chat() {
 
   socket.onopen = () => {
     const email = localStorage.getItem("userEmail");
-    socket.send(JSON.stringify({ email, mode }));
+    const token = localStorage.getItem("sessionToken");
+    // Sending the previous session_id resumes the conversation after a dropped connection.
+    const session_id = sessionStorage.getItem("chatSessionId");
+    socket.send(JSON.stringify({ email, token, mode, stream: mode === "text", session_id }));
     setWsConnected(true);
     // fetchFavourites();
     // fetchChatLogs();
@@ -65,14 +77,33 @@ function Chat() {
     try {
       const data = JSON.parse(event.data);
 
-      if (data.type === "suggestions") {
+      if (data.type === "session") {
+        sessionStorage.setItem("chatSessionId", data.session_id);
+        reconnectAttemptsRef.current = 0;
+        if (data.resumed && data.suggestions?.length) {
+          // The conversation was waiting for a recipe choice when the connection dropped.
+          setSuggestions(data.suggestions);
+          setExpectingChoice(true);
+        }
+      } else if (data.type === "suggestions") {
         setSuggestions(data.suggestions);
         setExpectingChoice(true);
         setShowThinking(true);
         setMessages((prev) => [...prev, { sender: "bot", text: data.message || "اختر وصفة من الخيارات التالية:" }]);
+      } else if (data.type === "delta") {
+        setShowThinking(false);
+        streamedTextRef.current += data.delta;
+        setTypingText(streamedTextRef.current);
       } else if (data.type === "response") {
         setShowThinking(false);
-        animateTyping(data.message);
+        if (streamedTextRef.current) {
+          // Already shown token by token, just commit the final message.
+          streamedTextRef.current = "";
+          setTypingText(null);
+          setMessages((prev) => [...prev, { sender: "bot", text: data.message }]);
+        } else {
+          animateTyping(data.message);
+        }
         setAwaitingResponse(false); // just in case there's no TTS
         if (mode === "voice") {
           setBotSpeaking(true);
@@ -84,6 +115,13 @@ function Chat() {
           setCurrentRecipeTitle(data.selected_title);
           setFullRecipeContent(prev => ({ ...prev, [data.selected_title]: data.full_recipe }));
         }
+      } else if (data.type === "error") {
+        // A reply can fail after some of it was streamed; drop the partial text.
+        streamedTextRef.current = "";
+        setTypingText(null);
+        setShowThinking(false);
+        setAwaitingResponse(false);
+        setMessages((prev) => [...prev, { sender: "bot", text: data.message }]);
       }
     } catch (e) {
       console.error("WebSocket message parsing error:", e);
@@ -91,9 +129,16 @@ function Chat() {
     }
   };
 
-  socket.onclose = () => {
+  socket.onclose = (event) => {
     console.warn("WebSocket connection closed.");
     setWsConnected(false);
+    if (event.code === 4000) return; // Taken over by a newer connection.
+    if (reconnectAttemptsRef.current < MAX_RECONNECT_ATTEMPTS) {
+      const delay = 1000 * 2 ** reconnectAttemptsRef.current;
+      reconnectAttemptsRef.current += 1;
+      setTimeout(connectWebSocket, delay);
+      return;
+    }
     handleCriticalError("The connection was lost. You will be redirected to the homepage.");
   };
 
@@ -108,6 +153,8 @@ function Chat() {
   const handleCriticalError = (message = "You're out of chats for today, please come back later! You will be logged out and returned to the homepage.") => {
   alert(message);
   localStorage.removeItem("userEmail");
+  localStorage.removeItem("sessionToken");
+  sessionStorage.removeItem("chatSessionId");
   window.location.href = "/";
 };
 
@@ -138,6 +185,7 @@ function Chat() {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        ...authHeaders(),
       },
       body: JSON.stringify({
         email,
@@ -183,7 +231,7 @@ const updatePreference = async (field, updatedList) => {
   try {
     await fetch(`http://localhost:8001/update-profile`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", ...authHeaders() },
       body: JSON.stringify({ email, field, updatedList })
     });
 
@@ -194,12 +242,26 @@ const updatePreference = async (field, updatedList) => {
 };
 
 
+  // The list only has summaries; the transcript is fetched when a chat is opened.
+  const openChatLog = async (chatId) => {
+  const email = localStorage.getItem("userEmail");
+  try {
+    const response = await fetch(`http://localhost:8001/get-chat-log/${chatId}?email=${email}`, { headers: authHeaders() });
+    const data = await response.json();
+    if (Array.isArray(data.chat)) {
+      setSelectedChatLog(data.chat);
+    }
+  } catch (err) {
+    console.error("Error fetching chat:", err);
+  }
+};
+
   const fetchChatLogs = async () => {
   const email = localStorage.getItem("userEmail");
   if (!email) return;
 
   try {
-    const response = await fetch(`http://localhost:8001/get-chat-logs?email=${email}`);
+    const response = await fetch(`http://localhost:8001/get-chat-logs?email=${email}`, { headers: authHeaders() });
     const data = await response.json();
     if (Array.isArray(data.chats)) {
       setChatLogs(data.chats);
@@ -214,7 +276,7 @@ const fetchUserProfile = async () => {
   if (!email) return;
 
   try {
-    const response = await fetch(`http://localhost:8001/get-profile?email=${email}`);
+    const response = await fetch(`http://localhost:8001/get-profile?email=${email}`, { headers: authHeaders() });
     const data = await response.json();
     setUserPrefs({
       name: data.name || "",
@@ -234,7 +296,7 @@ const fetchUserProfile = async () => {
   if (!email) return;
 
   try {
-    const response = await fetch(`http://localhost:8001/get-favourites?email=${email}`);
+    const response = await fetch(`http://localhost:8001/get-favourites?email=${email}`, { headers: authHeaders() });
     const data = await response.json();
     if (Array.isArray(data.favourites)) {
       setFavourites(data.favourites.map(f => f.title)); // get titles
@@ -423,7 +485,7 @@ const EditableListSection = ({ title, items, icon: Icon, onAdd, onDelete }) => {
 </div>
 
     {chatLogs.map((log, i) => (
-      <div key={i} className="chat-log-item" onClick={() => setSelectedChatLog(log.chat)}>
+      <div key={log._id || i} className="chat-log-item" onClick={() => openChatLog(log._id)}>
         Chat #{i + 1}
       </div>
     ))}
@@ -719,6 +781,8 @@ const EditableListSection = ({ title, items, icon: Icon, onAdd, onDelete }) => {
     className="new-chat-btn"
     onClick={() => {
       localStorage.removeItem("userEmail");
+      localStorage.removeItem("sessionToken");
+      sessionStorage.removeItem("chatSessionId");
       window.location.href = "/";
     }}
   >
@@ -15,7 +15,9 @@ function Login() {
     });
 
     if (res.ok) {
+      const data = await res.json();
       localStorage.setItem("userEmail", email);
+      localStorage.setItem("sessionToken", data.token);
       navigate("/chat");
     } else {
       const err = await res.json();
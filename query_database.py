@@ -1,34 +1,197 @@
-import chromadb
-import arabic_reshaper
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-
-# Initialize the model and embedding function
-model_name = "akhooli/Arabic-SBERT-100K"
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
-
-# Connect to the ChromaDB server using the HttpClient (assuming the server is running on localhost:8000)
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
-# Try to get the collection with the custom embedding function
-try:
-    collection = chroma_client.get_collection("recipestest", embedding_function=sentence_transformer_ef)
-    print("Collection 'recipes' found.")
-except chromadb.errors.InvalidCollectionException:
-    print("Collection 'recipes' does not exist. Please add data first using add_data_to_database.py.")
-    exit()
-
-# Function to query the database
-def search_recipe(query_text):
-    results = collection.query(
-        query_texts=[query_text], 
-        n_results=4,
-    )
-
-    print("Search Results:")
-    print(results)
-    for result in results["documents"]:
-        print(arabic_reshaper.reshape(result[0])[::-1])
-
-# Example search query
-search_recipe("ورق عنب")
+"""
+Retrieval benchmark for the recipe vector store.
+
+    python query_database.py --query "ورق عنب"                   # show the results for one query
+    python query_database.py --generate --save-queries queries.json
+    python query_database.py --queries queries.json --backend mmap --mode hybrid --output run.json
+    python query_database.py --queries queries.json --baseline run.json
+
+A query set is a JSON list (or JSONL file) of {"query": ..., "expected": "recipe_012.txt"}
+items. Without --queries, queries are generated from the titles of the recipe files.
+The report gives recall@1, recall@5, MRR, queries per second and per-query latency
+percentiles; --output saves it with the rank of every query for later comparison.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from arabic_text import strip_diacritics  # noqa: E402
+from corpus import CORPUS_DIR, load_corpus  # noqa: E402
+
+REQUEST_TEMPLATE = "عايز أعمل {title}"
+RECALL_AT = (1, 5)
+
+
+def _document_key(document: str) -> str:
+    return hashlib.sha1(document.strip().encode("utf-8")).hexdigest()
+
+
+def _recipe_id(label: str) -> str:
+    return os.path.splitext(os.path.basename(label))[0]
+
+
+def generate_queries(recipes: dict, seed: int = 0) -> list:
+    """
+    Synthetic labelled queries from recipe titles: the bare title, a request
+    sentence, the first words of long titles and a title with one typo.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for recipe_id, recipe in recipes.items():
+        expected = f"{recipe_id}.txt"
+        title = " ".join(strip_diacritics(recipe["title"]).split())
+        words = title.split()
+        queries.append({"query": title, "expected": expected, "kind": "title"})
+        queries.append({"query": REQUEST_TEMPLATE.format(title=title), "expected": expected, "kind": "request"})
+        if len(words) >= 3:
+            queries.append({"query": " ".join(words[:2]), "expected": expected, "kind": "partial"})
+        long_words = [i for i, word in enumerate(words) if len(word) >= 4]
+        if long_words:
+            i = rng.choice(long_words)
+            cut = rng.randrange(1, len(words[i]) - 1)
+            typo = words[:i] + [words[i][:cut] + words[i][cut + 1:]] + words[i + 1:]
+            queries.append({"query": " ".join(typo), "expected": expected, "kind": "typo"})
+    return queries
+
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def percentiles(values: list) -> dict:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50 * 1000, 2), "p95": round(p95 * 1000, 2), "p99": round(p99 * 1000, 2),
+            "max": round(max(values) * 1000, 2)}
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    ranks = [result["rank"] for result in results]
+    summary = {
+        "queries": len(results),
+        **{f"recall@{k}": round(sum(1 for rank in ranks if rank and rank <= k) / len(ranks), 4) for k in RECALL_AT},
+        "mrr": round(sum(1 / rank for rank in ranks if rank) / len(ranks), 4),
+        "qps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles([result["seconds"] for result in results]),
+    }
+    kinds = sorted({result["kind"] for result in results if result.get("kind")})
+    if len(kinds) > 1:
+        summary["by_kind"] = {
+            kind: {
+                "queries": sum(1 for result in results if result.get("kind") == kind),
+                "recall@1": round(sum(1 for result in results if result.get("kind") == kind and result["rank"] == 1)
+                                  / sum(1 for result in results if result.get("kind") == kind), 4),
+            }
+            for kind in kinds
+        }
+    return summary
+
+
+def run_benchmark(engine, queries: list, recipes: dict, top_k: int) -> dict:
+    # Search results carry the recipe text, not its file, so they are mapped back
+    # through the document (and the title as a fallback).
+    by_document = {_document_key(recipe["document"]): recipe_id for recipe_id, recipe in recipes.items()}
+    by_title = {recipe["title"]: recipe_id for recipe_id, recipe in recipes.items()}
+
+    engine.load()
+    engine.search("تسخين")  # builds the lexical index and warms the model outside the timings
+
+    results = []
+    started = time.perf_counter()
+    for item in queries:
+        query_started = time.perf_counter()
+        found = engine.search(item["query"], top_k)
+        seconds = time.perf_counter() - query_started
+
+        retrieved = [by_document.get(_document_key(doc["document"])) or by_title.get(doc["title"]) for doc in found]
+        expected = _recipe_id(item["expected"])
+        rank = retrieved.index(expected) + 1 if expected in retrieved else None
+        results.append({**item, "rank": rank, "retrieved": retrieved, "seconds": seconds})
+    elapsed = time.perf_counter() - started
+
+    return {"summary": summarize(results, elapsed), "results": results}
+
+
+def print_summary(summary: dict, baseline: dict = None):
+    def delta(key, value):
+        if not baseline or key not in baseline:
+            return ""
+        return f" ({value - baseline[key]:+.4f})"
+
+    print(f"queries:   {summary['queries']}")
+    for key in [f"recall@{k}" for k in RECALL_AT] + ["mrr", "qps"]:
+        print(f"{key + ':':<10} {summary[key]}{delta(key, summary[key])}")
+    latency = summary["latency_ms"]
+    print(f"latency:   p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, max {latency['max']} ms")
+    for kind, stats in summary.get("by_kind", {}).items():
+        print(f"  {kind:<10} recall@1 {stats['recall@1']} over {stats['queries']} queries")
+
+
+def show_query(engine, query: str, top_k: int):
+    import arabic_reshaper
+
+    for i, doc in enumerate(engine.search(query, top_k), 1):
+        # Reshaped and reversed so the Arabic reads correctly in a plain terminal.
+        print(f"{i}. {arabic_reshaper.reshape(doc['title'])[::-1]}")
+
+
+def main():
+    from retrieval import VECTOR_BACKEND, RETRIEVAL_MODE, RetrievalEngine, create_backend
+
+    parser = argparse.ArgumentParser(description="Benchmark recipe retrieval against a labelled query set.")
+    parser.add_argument("--query", help="Only print the results for this query.")
+    parser.add_argument("--queries", help="Labelled query set (.json list or .jsonl).")
+    parser.add_argument("--generate", action="store_true", help="Generate queries from the recipe titles.")
+    parser.add_argument("--save-queries", help="Write the query set used to this file.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Directory with recipe_NNN.txt files.")
+    parser.add_argument("--backend", default=VECTOR_BACKEND, choices=["chroma", "mmap"])
+    parser.add_argument("--mode", default=RETRIEVAL_MODE, choices=["hybrid", "vector"])
+    parser.add_argument("--top-k", type=int, default=max(RECALL_AT))
+    parser.add_argument("--cache", action="store_true", help="Keep the query caches on (off measures raw search).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    parser.add_argument("--baseline", help="Earlier --output report to compare with.")
+    args = parser.parse_args()
+
+    cache_size = 1024 if args.cache else 0
+    engine = RetrievalEngine(backend=create_backend(args.backend), mode=args.mode, cache_maxsize=cache_size)
+
+    if args.query:
+        show_query(engine, args.query, args.top_k)
+        return
+
+    recipes = load_corpus(args.corpus)
+    queries = load_queries(args.queries) if args.queries and not args.generate else generate_queries(recipes, args.seed)
+    if args.save_queries:
+        with open(args.save_queries, "w", encoding="utf-8") as f:
+            json.dump(queries, f, ensure_ascii=False, indent=2)
+
+    report = run_benchmark(engine, queries, recipes, args.top_k)
+    report["config"] = {
+        "backend": args.backend, "mode": args.mode, "top_k": args.top_k, "cache": args.cache,
+        "model": engine.model_name, "queries": args.queries or "generated",
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+    print_summary(report["summary"], baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()